@@ -1,9 +1,17 @@
 import os
+import uuid
 import logging
-from flask import Flask, render_template, request, jsonify, session
-from weather_api import get_weather_data, get_weather_alerts, get_forecast
-from chatbot import get_chatbot_response
+import threading
+from flask import Flask, render_template, request, jsonify, session, g, Response, redirect, url_for
+from weather_api import get_weather_data, get_weather_alerts, get_forecast, get_fetcher
+from weather_api import warmup as warmup_weather_api
+from chatbot import get_chatbot_response, get_chatbot_responses, BatchTooLargeError
+from chatbot import warmup as warmup_chatbot
 from flask_cors import CORS
+# Profiling stays an eager import: its hooks run on every request, and its
+# shared settings must be created in the master before workers are forked
+import profiling
+from profiling import span
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -19,6 +27,67 @@ OPENWEATHER_API_KEY = os.environ.get("OPENWEATHER_API_KEY", "6314d6786d074e1195a
 if not OPENWEATHER_API_KEY:
     logger.warning("OpenWeatherMap API key not set. Weather data may not be available.")
 
+# Live weather subscriptions, one refresh loop per subscribed location. The
+# hub and its module are only loaded by the first /api/live request.
+_live_hub = None
+_live_hub_lock = threading.Lock()
+
+def get_live_hub():
+    """
+    Returns:
+        LiveWeatherHub: This process's live weather hub, created on first use.
+    """
+    global _live_hub
+    if _live_hub is None:
+        with _live_hub_lock:
+            if _live_hub is None:
+                from live_updates import LiveWeatherHub
+                _live_hub = LiveWeatherHub(
+                    OPENWEATHER_API_KEY,
+                    interval=float(os.environ.get("LIVE_REFRESH_INTERVAL", "60")),
+                    forecast_interval=float(os.environ.get("LIVE_FORECAST_INTERVAL", "600")),
+                    max_feeds=int(os.environ.get("LIVE_MAX_FEEDS", "100")),
+                    max_subscriptions=int(os.environ.get("LIVE_MAX_STREAMS", "32")),
+                    max_failures=int(os.environ.get("LIVE_MAX_FAILURES", "3"))
+                )
+    return _live_hub
+LIVE_MAX_LOCATIONS = int(os.environ.get("LIVE_MAX_LOCATIONS", "10"))
+
+# Largest number of messages accepted by /api/chatbot/batch
+CHATBOT_BATCH_MAX_MESSAGES = int(os.environ.get("CHATBOT_BATCH_MAX_MESSAGES", "500"))
+
+@app.before_request
+def start_profiling():
+    """Profile the request if it is sampled or carries a valid X-Profile header."""
+    header = request.headers.get('X-Profile')
+    requested = bool(header) and profiling.is_admin(header)
+    if requested or profiling.should_profile():
+        g.profile_token = profiling.start(f"{request.method} {request.path}")
+        g.profile_requested = requested
+
+@app.after_request
+def finish_profiling(response):
+    """
+    Report the spans of a request profiled through X-Profile in the
+    Server-Timing header. Sampled requests keep their timings internal.
+    """
+    token = g.pop('profile_token', None)
+    if token is not None:
+        summary = profiling.finish(token)
+        if not g.pop('profile_requested', False):
+            return response
+        timings = [f"{s['name']};dur={s['duration_ms']}" for s in summary['spans']]
+        timings.append(f"total;dur={summary['total_ms']}")
+        response.headers['Server-Timing'] = ', '.join(timings)
+    return response
+
+@app.teardown_request
+def abandon_profiling(exc):
+    """Finish profiling for requests that failed before after_request ran."""
+    token = g.pop('profile_token', None)
+    if token is not None:
+        profiling.finish(token)
+
 @app.route('/')
 def index():
     """Render the main page of the weather app."""
@@ -29,8 +98,10 @@ def weather():
     """API endpoint to get current weather data."""
     location = request.args.get('location', 'New York')
     try:
-        weather_data = get_weather_data(location, api_key=OPENWEATHER_API_KEY)
-        return jsonify(weather_data)
+        with span('fetch'):
+            weather_data = get_weather_data(location, api_key=OPENWEATHER_API_KEY)
+        with span('serialization'):
+            return jsonify(weather_data)
     except Exception as e:
         logger.error(f"Error fetching weather data: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -40,8 +111,10 @@ def forecast():
     """API endpoint to get weather forecast."""
     location = request.args.get('location', 'New York')
     try:
-        forecast_data = get_forecast(location, api_key=OPENWEATHER_API_KEY)
-        return jsonify(forecast_data)
+        with span('fetch'):
+            forecast_data = get_forecast(location, api_key=OPENWEATHER_API_KEY)
+        with span('serialization'):
+            return jsonify(forecast_data)
     except Exception as e:
         logger.error(f"Error fetching forecast data: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -51,12 +124,154 @@ def alerts():
     """API endpoint to get weather alerts."""
     location = request.args.get('location', 'New York')
     try:
-        alerts_data = get_weather_alerts(location, api_key=OPENWEATHER_API_KEY)
-        return jsonify(alerts_data)
+        with span('fetch'):
+            alerts_data = get_weather_alerts(location, api_key=OPENWEATHER_API_KEY)
+        with span('serialization'):
+            return jsonify(alerts_data)
     except Exception as e:
         logger.error(f"Error fetching alerts data: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+# Caching for guides: versioned URLs never change, the others are revalidated
+GUIDE_IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+GUIDE_REVALIDATE_CACHE = 'public, max-age=300, must-revalidate'
+
+def _guides():
+    # Imported on first use. Gunicorn's master builds the guides before forking,
+    # so production workers find them already loaded.
+    from guides import get_guides
+    return get_guides()
+
+def _guide_response(document, cache_control):
+    """Serve a precomputed guide document in the client's preferred encoding."""
+    encoding, body = document.negotiate(request.headers.get('Accept-Encoding'))
+    etag = document.etag(encoding)
+    headers = {'ETag': etag, 'Cache-Control': cache_control, 'Vary': 'Accept-Encoding'}
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    # Parsed list of ETags, which also honours If-None-Match: *
+    if request.if_none_match.contains_weak(etag.strip('"')):
+        return Response(status=304, headers=headers)
+    return Response(body, mimetype='application/json', headers=headers)
+
+@app.route('/api/guides', methods=['GET'])
+def guide_index():
+    """API endpoint listing every safety guide with its versioned URL."""
+    return _guide_response(_guides()['index'], GUIDE_REVALIDATE_CACHE)
+
+@app.route('/api/guides/<hazard>', methods=['GET'])
+def guide(hazard):
+    """API endpoint for the current safety guide of a hazard."""
+    document = _guides()['guides'].get(hazard.lower())
+    if document is None:
+        return jsonify({"error": f"No guide for '{hazard}'"}), 404
+    return _guide_response(document, GUIDE_REVALIDATE_CACHE)
+
+@app.route('/api/guides/<hazard>/<digest>', methods=['GET'])
+def versioned_guide(hazard, digest):
+    """
+    API endpoint for a content-addressed safety guide. The content behind a
+    digest never changes, so it is cached as immutable. Outdated digests
+    redirect to the current version.
+    """
+    document = _guides()['guides'].get(hazard.lower())
+    if document is None:
+        return jsonify({"error": f"No guide for '{hazard}'"}), 404
+    if digest != document.digest:
+        return redirect(url_for('versioned_guide', hazard=hazard.lower(), digest=document.digest))
+    return _guide_response(document, GUIDE_IMMUTABLE_CACHE)
+
+@app.route('/api/live', methods=['GET'])
+def live_weather():
+    """
+    Server-Sent Events stream of weather changes for a set of locations.
+    
+    Subscribe with ?locations=London,Paris. Each event carries only the fields
+    that changed since the previous one.
+    """
+    locations = [l for l in request.args.get('locations', 'New York').split(',') if l.strip()]
+    if not locations:
+        return jsonify({"error": "At least one location is required"}), 400
+    if len(locations) > LIVE_MAX_LOCATIONS:
+        return jsonify({"error": f"At most {LIVE_MAX_LOCATIONS} locations are allowed per subscription"}), 400
+    
+    from live_updates import LiveCapacityError
+    try:
+        subscription = get_live_hub().subscribe(locations)
+    except LiveCapacityError as e:
+        logger.warning(f"Rejected live subscription: {str(e)}")
+        return jsonify({"error": str(e)}), 503, {'Retry-After': '30'}
+    return Response(
+        subscription.events(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/live/stats', methods=['GET'])
+def live_stats():
+    """API endpoint for live subscription counts of this worker."""
+    return jsonify(get_live_hub().stats() if _live_hub is not None else {})
+
+@app.route('/api/upstream/stats', methods=['GET'])
+def upstream_stats():
+    """API endpoint for upstream request, hedge and fallback metrics of this worker."""
+    return jsonify(get_fetcher(OPENWEATHER_API_KEY).stats())
+
+def _is_admin_request():
+    return profiling.is_admin(request.headers.get('X-Admin-Token'))
+
+def _admin_json(data):
+    """Profiling results are per worker, so say which worker answered."""
+    response = jsonify({**data, 'pid': os.getpid()})
+    response.headers['X-Worker-Pid'] = str(os.getpid())
+    return response
+
+@app.route('/admin/profile', methods=['GET', 'POST'])
+def profile_settings():
+    """
+    Admin endpoint to read or change profiling settings.
+    
+    POST a JSON body with any of sample_rate (0-1), interval (seconds between
+    stack samples) and reset (true to discard collected data).
+    """
+    if not _is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    if request.method == 'GET':
+        return _admin_json(profiling.settings())
+    data = request.get_json(silent=True) or {}
+    try:
+        settings = profiling.configure(sample_rate=data.get('sample_rate'), interval=data.get('interval'))
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    if data.get('reset'):
+        profiling.reset()
+    logger.info(f"Profiling settings changed: {settings}")
+    return _admin_json(settings)
+
+@app.route('/admin/profile/spans', methods=['GET'])
+def profile_spans():
+    """Admin endpoint for the per-request span breakdown of profiled requests."""
+    if not _is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    return _admin_json(profiling.span_report())
+
+@app.route('/admin/profile/stacks', methods=['GET'])
+def profile_stacks():
+    """
+    Admin endpoint to download sampled stacks, as collapsed stacks by default
+    or as a flame graph tree with ?format=json.
+    """
+    if not _is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    if request.args.get('format') == 'json':
+        return _admin_json(profiling.flame_graph())
+    return Response(
+        profiling.collapsed_stacks(),
+        mimetype='text/plain',
+        headers={'Content-Disposition': 'attachment; filename=stacks.collapsed',
+                 'X-Worker-Pid': str(os.getpid())}
+    )
+
 @app.route('/api/chatbot', methods=['POST'])
 def chatbot():
     """API endpoint for chatbot interactions."""
@@ -74,16 +289,72 @@ def chatbot():
         user_message = data.get('message', '')
         logger.debug(f"Extracted user message: '{user_message}'")
         
+        # Identify the conversation so follow-up questions keep their context
+        if 'conversation_id' not in session:
+            session['conversation_id'] = uuid.uuid4().hex
+        
         # Get the chatbot response
-        response = get_chatbot_response(user_message)
+        response = get_chatbot_response(user_message, session=session)
         logger.debug(f"Generated response: '{response}'")
         
         # Return the response
-        return jsonify({"response": response})
+        with span('serialization'):
+            return jsonify({"response": response})
     except Exception as e:
         logger.error(f"Error processing chatbot message: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+def preload():
+    """
+    Build the read-only state every worker uses: compiled chatbot patterns and
+    the precomputed guides. Gunicorn's master calls this before forking, so
+    workers share it copy-on-write instead of each building its own.
+    """
+    warmup_chatbot()
+    _guides()
+
+def warmup():
+    """
+    Prime caches and connection pools before a worker starts taking traffic.
+    
+    Set WARMUP_UPSTREAM=0 to skip opening a connection to OpenWeatherMap.
+    """
+    # Already done in a preloaded master, in which case this is a no-op
+    preload()
+    if os.environ.get("WARMUP_UPSTREAM", "1") == "1":
+        warmup_weather_api()
+    # Exercise routing and JSON encoding once so lazy Flask internals are built
+    with app.test_client() as client:
+        client.post('/api/chatbot', json={'message': 'hello'})
+    logger.info("Worker warmup complete")
+
+@app.route('/api/chatbot/batch', methods=['POST'])
+def chatbot_batch():
+    """
+    API endpoint to answer many independent chatbot messages at once.
+    
+    Expects {"messages": [...]} and returns {"responses": [...]} in the same
+    order. Each distinct city is fetched once for the whole batch.
+    """
+    try:
+        data = request.get_json(silent=True)
+        messages = data.get('messages') if isinstance(data, dict) else None
+        if not isinstance(messages, list) or not all(isinstance(m, str) for m in messages):
+            logger.error("Batch chatbot request without a list of messages")
+            return jsonify({"error": "Expected a JSON body with a 'messages' list of strings"}), 400
+        if len(messages) > CHATBOT_BATCH_MAX_MESSAGES:
+            return jsonify({"error": f"At most {CHATBOT_BATCH_MAX_MESSAGES} messages are allowed per batch"}), 413
+        
+        try:
+            responses = get_chatbot_responses(messages)
+        except BatchTooLargeError as e:
+            return jsonify({"error": str(e)}), 413
+        with span('serialization'):
+            return jsonify({"responses": responses})
+    except Exception as e:
+        logger.error(f"Error processing chatbot batch: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.errorhandler(404)
 def page_not_found(e):
     """Handle 404 errors."""
@@ -0,0 +1,87 @@
+"""
+Tail latency benchmark for hedged weather requests.
+
+Starts two local stand-in OpenWeatherMap servers: a primary that injects a slow
+response into a fraction of requests, and a fast secondary. Then compares
+latency percentiles with and without hedging.
+
+Usage:
+    python benchmarks/hedging.py [--requests 600] [--slow-rate 0.05] [--slow-delay 0.5]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from weather_api import HedgedFetcher, OpenWeatherMapProvider
+
+def start_stand_in(name, slow_rate, slow_delay, base_delay=0.01):
+    """Serve a fixed /data/2.5/weather response with injected latency on a free port."""
+    body = json.dumps({
+        'name': name,
+        'sys': {'country': 'GB', 'sunrise': 1700000000, 'sunset': 1700030000},
+        'main': {'temp': 4.2, 'feels_like': 1.0, 'humidity': 80, 'pressure': 1010},
+        'wind': {'speed': 5.1},
+        'weather': [{'description': 'light rain', 'icon': '10d'}]
+    }).encode('utf-8')
+    
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(slow_delay if random.random() < slow_rate else base_delay)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, *args):
+            pass
+    
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+def measure(fetcher, count, skip):
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        fetcher.fetch('London')
+        latencies.append(time.perf_counter() - start)
+    # Skip the first requests while the fetcher collects latency samples
+    latencies = sorted(latencies[skip:])
+    return {p: latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] * 1000 for p in (50, 95, 99)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=600)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-delay", type=float, default=0.5)
+    parser.add_argument("--budget", type=float, default=0.1)
+    parser.add_argument("--percentile", type=float, default=90)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    
+    primary = OpenWeatherMapProvider('bench', base_url=start_stand_in('primary', args.slow_rate, args.slow_delay))
+    secondary = OpenWeatherMapProvider('bench', base_url=start_stand_in('secondary', 0, 0), name='secondary')
+    skip = min(100, args.requests // 5)
+    
+    runs = {
+        'single': HedgedFetcher([primary], hedge_budget=0),
+        'hedged': HedgedFetcher([primary, secondary], hedge_budget=args.budget, hedge_percentile=args.percentile)
+    }
+    for name, fetcher in runs.items():
+        result = measure(fetcher, args.requests, skip)
+        print(f"{name:>7}: p50 {result[50]:7.1f} ms  p95 {result[95]:7.1f} ms  p99 {result[99]:7.1f} ms")
+    stats = runs['hedged'].stats()
+    print(f"hedges sent {stats['hedges_sent']}/{stats['requests']}, won {stats['hedge_wins']} "
+          f"({stats['hedge_win_rate']:.0%}), over budget {stats['hedges_over_budget']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Cold start benchmark: app import time and first request latency.
+
+Every sample runs in a fresh interpreter so nothing is cached between runs.
+
+Usage:
+    python benchmarks/startup.py [--runs 10] [--warmup]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SAMPLE = '''
+import json, logging, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+logging.disable(logging.CRITICAL)
+if {warmup}:
+    app.warmup()
+warmed = time.perf_counter()
+client = app.app.test_client()
+client.post('/api/chatbot', json={{'message': 'Tell me about flood safety'}})
+done = time.perf_counter()
+print(json.dumps({{
+    'import_ms': (imported - start) * 1000,
+    'warmup_ms': (warmed - imported) * 1000,
+    'first_request_ms': (done - warmed) * 1000,
+}}))
+'''
+
+def run_sample(warmup):
+    env = dict(os.environ, WARMUP_UPSTREAM="0")
+    output = subprocess.run(
+        [sys.executable, "-c", SAMPLE.format(warmup=warmup)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--warmup", action="store_true", help="call app.warmup() before the first request")
+    args = parser.parse_args()
+    
+    samples = [run_sample(args.warmup) for _ in range(args.runs)]
+    for key in ('import_ms', 'warmup_ms', 'first_request_ms'):
+        values = [sample[key] for sample in samples]
+        print(f"{key:>18}: median {statistics.median(values):8.2f}  min {min(values):8.2f}  max {max(values):8.2f}")
+
+if __name__ == "__main__":
+    main()
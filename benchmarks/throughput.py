@@ -0,0 +1,49 @@
+"""
+Throughput benchmark for the weather endpoints, served from a recorded archive.
+
+Record an archive once against the real upstream, e.g.
+    WEATHER_UPSTREAM_MODE=record python main.py
+and query the locations you want to benchmark. Then run:
+    python benchmarks/throughput.py --archive upstream_archive --locations London Paris
+
+No network is used. Pass --latency to replay recorded upstream latencies.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--archive", default="upstream_archive")
+    parser.add_argument("--locations", nargs="+", default=["New York"])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--endpoint", default="/api/weather")
+    parser.add_argument("--latency", action="store_true", help="sleep for recorded upstream latencies")
+    args = parser.parse_args()
+    
+    # The weather session reads these when it is first created
+    os.environ["WEATHER_UPSTREAM_MODE"] = "replay"
+    os.environ["WEATHER_ARCHIVE_DIR"] = os.path.abspath(args.archive)
+    os.environ["WEATHER_REPLAY_LATENCY"] = "1" if args.latency else "0"
+    sys.path.insert(0, ROOT)
+    import app
+    logging.disable(logging.CRITICAL)
+    
+    client = app.app.test_client()
+    failures = 0
+    start = time.perf_counter()
+    for i in range(args.requests):
+        location = args.locations[i % len(args.locations)]
+        if client.get(args.endpoint, query_string={'location': location}).status_code != 200:
+            failures += 1
+    elapsed = time.perf_counter() - start
+    
+    print(f"{args.requests} requests in {elapsed:.2f}s: {args.requests / elapsed:.0f} req/s, "
+          f"{elapsed / args.requests * 1000:.3f} ms/request, {failures} failures")
+
+if __name__ == "__main__":
+    main()
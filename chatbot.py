@@ -3,7 +3,12 @@ import random
 import logging
 from datetime import datetime
 import os
-from weather_api import get_weather_data
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from weather_api import fetch_observation
+from conversation import ConversationStore
+from profiling import span
+from chatbot_responses import WEATHER_RESPONSES, GENERAL_TIPS, GREETINGS, FAREWELLS, UNKNOWN_RESPONSES
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -12,98 +17,84 @@ logger = logging.getLogger(__name__)
 # Get OpenWeatherMap API key
 OPENWEATHER_API_KEY = os.environ.get("OPENWEATHER_API_KEY", "6314d6786d074e1195a9e6f69b973a67")
 
-# Enhanced dictionary of weather-related keywords and responses
-WEATHER_RESPONSES = {
-    'rain': [
-        "During rain, it's important to:\n• Carry an umbrella or wear a waterproof raincoat\n• Drive cautiously as roads become slippery\n• Avoid flooded areas - just 6 inches of water can sweep you off your feet\n• Ensure proper drainage around your home to prevent water damage\n• Stay indoors during thunderstorms and lightning",
-        "Rainy conditions require these safety measures:\n• Use headlights while driving to improve visibility\n• Avoid driving through flooded areas - water can damage your engine\n• Be cautious of hydroplaning by reducing speed\n• Have proper rain gear if you need to go outside\n• Check weather alerts for flash flood warnings",
-        "When it's raining, remember to:\n• Keep electronic devices away from water\n• Watch for lightning and seek shelter if thunderstorms develop\n• Allow extra time for travel and commuting\n• Have a backup plan for outdoor activities\n• Monitor local weather updates for changing conditions"
-    ],
-    'snow': [
-        "In snowy conditions, your safety depends on:\n• Dressing in warm, waterproof layers and proper footwear\n• Driving slowly with increased following distance\n• Keeping emergency supplies in your vehicle (blankets, food, water)\n• Clearing snow from walkways and driveways to prevent falls\n• Checking on elderly neighbors who may need assistance",
-        "When snow is in the forecast:\n• Prepare your home by insulating pipes to prevent freezing\n• Stock up on essentials before the storm arrives\n• Plan for potential power outages with alternative heat sources\n• Use snow tires or chains when driving is necessary\n• Remove snow from roofs if accumulation becomes heavy",
-        "Snow safety tips include:\n• Avoiding overexertion when shoveling - take breaks and stay hydrated\n• Being aware of signs of hypothermia and frostbite\n• Keeping your cell phone charged in case of emergency\n• Having alternative communication methods if power fails\n• Staying updated on road closures and travel advisories"
-    ],
-    'storm': [
-        "During a storm, protect yourself by:\n• Staying indoors and away from windows\n• Securing outdoor objects that could become projectiles\n• Having emergency supplies ready (flashlights, batteries, radio)\n• Unplugging electronic devices to prevent damage from lightning\n• Moving to an interior room on the lowest floor if severe",
-        "Storm safety is critical - remember to:\n• Create a family communication plan before storms arrive\n• Know the difference between watches (possible) and warnings (imminent)\n• Keep trees trimmed to prevent damage from falling branches\n• Have multiple ways to receive weather alerts\n• Prepare for power outages with backup charging options",
-        "When storms threaten, take these precautions:\n• Fill bathtubs with water for sanitation needs if water service is interrupted\n• Keep important documents in waterproof containers\n• Have a plan for pets and livestock\n• Know evacuation routes if you live in a flood-prone area\n• Avoid using landline phones during lightning storms"
-    ],
-    'hurricane': [
-        "Hurricane preparedness includes:\n• Creating a comprehensive evacuation plan and following official orders\n• Securing your home - board up windows and reinforce doors\n• Assembling an emergency kit with 3-7 days of supplies\n• Keeping important documents in waterproof containers\n• Having cash on hand as ATMs may not work during power outages",
-        "Before a hurricane arrives:\n• Know your evacuation zone and have multiple route options\n• Clear gutters and drains to prevent water damage\n• Fill your vehicle's gas tank and prepare backup transportation\n• Store outdoor furniture and other items that could become projectiles\n• Have medication supplies for at least two weeks",
-        "Hurricane safety requires:\n• Understanding the dangers of storm surge - the deadliest hurricane hazard\n• Never ignoring evacuation orders from local authorities\n• Maintaining multiple communication methods\n• Preparing for extended power and water outages\n• Having a plan for family members with special needs"
-    ],
-    'tornado': [
-        "During a tornado warning:\n• Seek shelter immediately in a basement or interior room on the lowest floor\n• Stay away from windows and cover yourself with blankets or a mattress\n• Put on sturdy shoes and helmet for head protection\n• Keep a whistle to signal for help if trapped\n• If in a vehicle, never try to outrun a tornado - seek sturdy shelter",
-        "Tornado safety depends on quick action:\n• Know the warning signs: dark/greenish sky, large hail, loud roar\n• Practice tornado drills with your family regularly\n• Identify safe rooms in advance - interior rooms with no windows\n• Have weather alert radios with battery backup\n• After a tornado, watch for downed power lines and gas leaks",
-        "If a tornado threatens:\n• Mobile homes provide little protection - seek sturdier shelter\n• If caught outside with no shelter, lie flat in a ditch away from vehicles\n• Never shelter under an overpass - wind speeds increase in these areas\n• Keep emergency supplies in your designated shelter area\n• Have a plan for reuniting with family members"
-    ],
-    'heat': [
-        "During extreme heat:\n• Stay hydrated by drinking plenty of water, even if not thirsty\n• Avoid outdoor activities during peak heat (10am-4pm)\n• Wear lightweight, light-colored, loose-fitting clothing\n• Use air conditioning or spend time in public cooled places\n• Check on elderly neighbors and those with health conditions",
-        "Heat safety is essential:\n• Never leave children or pets in vehicles, even briefly\n• Take cool showers or baths to lower body temperature\n• Use fans with open windows to create cross-ventilation\n• Recognize heat illness symptoms: headache, dizziness, nausea\n• Limit strenuous activities and take frequent breaks in shade",
-        "Protecting yourself in hot weather means:\n• Eating lighter meals that don't require cooking\n• Avoiding alcohol and caffeine which can cause dehydration\n• Applying sunscreen (SPF 15+) and reapplying every 2 hours\n• Wearing a wide-brimmed hat and sunglasses outdoors\n• Knowing the difference between heat exhaustion and heat stroke"
-    ],
-    'cold': [
-        "In extreme cold conditions:\n• Dress in layers with moisture-wicking inner layers\n• Keep head, hands, feet, and face well protected\n• Limit time outdoors and watch for signs of hypothermia and frostbite\n• Maintain emergency supplies in your home and vehicle\n• Check heating systems and carbon monoxide detectors",
-        "Cold weather safety requires:\n• Understanding wind chill factor which accelerates heat loss\n• Avoiding alcohol which gives a false sense of warmth\n• Keeping moving to generate body heat when outdoors\n• Preparing for winter travel with emergency car kits\n• Having alternative heating methods in case of power failure",
-        "When temperatures drop dangerously low:\n• Know the symptoms of hypothermia: shivering, confusion, drowsiness\n• Recognize frostbite signs: numbness, white/grayish skin, firm/waxy feel\n• Keep pets indoors or provide adequate shelter\n• Prevent frozen pipes by maintaining heat and allowing faucets to drip\n• Check on elderly or disabled neighbors who may need assistance"
-    ],
-    'flood': [
-        "During flooding events:\n• Never walk or drive through floodwaters - 6 inches of moving water can knock you down\n• Move to higher ground and avoid bridges over fast-moving water\n• Disconnect utilities if instructed and avoid electrical equipment if wet\n• Prepare an emergency kit and know evacuation routes\n• After floods, be aware of contaminated water and damaged roadways",
-        "Flood safety measures include:\n• Elevating electrical systems and waterproofing basements if in flood-prone areas\n• Having flood insurance even if not in a high-risk zone\n• Keeping important documents in waterproof containers\n• Following evacuation orders immediately\n• Avoiding contact with floodwater which may contain sewage and chemicals",
-        "When flooding threatens:\n• Know the difference between flood watch (possible) and warning (occurring)\n• Have multiple ways to receive emergency alerts\n• Plan for pets and livestock evacuation\n• Practice your evacuation route before flooding occurs\n• After flooding, document damage for insurance and be aware of mold risks"
-    ],
-    'earthquake': [
-        "During an earthquake:\n• Drop, cover, and hold on - get under sturdy furniture\n• Stay away from windows, exterior walls, and heavy objects that could fall\n• If in bed, stay there and protect your head with a pillow\n• If outdoors, move to an open area away from buildings and utility wires\n• After shaking stops, be prepared for aftershocks",
-        "Earthquake preparedness includes:\n• Securing heavy furniture, appliances, and hanging objects\n• Identifying safe spots in each room (under sturdy tables, against interior walls)\n• Having emergency supplies accessible\n• Knowing how to shut off gas, water, and electricity\n• Creating a family communication plan with meeting places",
-        "After an earthquake:\n• Check yourself and others for injuries before moving\n• Evacuate if your building is damaged or if you smell gas\n• Avoid using elevators or damaged staircases\n• Be cautious of fallen power lines and broken gas lines\n• Monitor local news for emergency information and instructions"
-    ],
-    'wildfire': [
-        "If wildfires threaten your area:\n• Be ready to evacuate at a moment's notice - have go-bags prepared\n• Create defensible space around your home by clearing vegetation\n• Close all windows, vents, and doors to prevent embers from entering\n• Move flammable furniture away from exterior walls\n• Follow evacuation routes provided by local authorities",
-        "Wildfire safety requires preparation:\n• Maintain an emergency supply kit ready to go\n• Have a family communication plan with meeting locations\n• Register for emergency alert systems in your area\n• Keep important documents in fire-resistant containers\n• Know multiple evacuation routes from your neighborhood",
-        "During wildfire season:\n• Stay informed about fire conditions and air quality\n• Keep your vehicle fueled and ready for quick evacuation\n• Wear proper clothing if near smoke: long sleeves, pants, N95 masks\n• Follow all fire restrictions and bans in your area\n• After fires, be aware of flash flood risks in burn scar areas"
-    ]
-}
-
-# Enhanced general weather preparedness tips
-GENERAL_TIPS = [
-    "Creating a comprehensive emergency preparedness plan involves:\n• Assembling an emergency kit with water (1 gallon per person per day)\n• Stocking non-perishable food, medications, and first aid supplies\n• Including battery-powered radio, flashlights, and extra batteries\n• Having cash in small denominations and copies of important documents\n• Planning for specific needs of family members, pets, and the elderly",
-    
-    "Family emergency planning should include:\n• Establishing meeting places both in your neighborhood and outside the area\n• Identifying an out-of-area contact everyone can communicate through\n• Practicing evacuation routes and shelter locations\n• Knowing how to shut off utilities at your home\n• Creating emergency contact cards for each family member",
+# Enhanced patterns to handle both weather and travel queries
+CITY_PATTERNS = [
+    # Weather patterns
+    r'weather\s+in\s+([A-Za-z]+(?:\s+[A-Za-z]+)*)',
+    r'what(?:\'s|\s+is)\s+(?:the\s+)?weather\s+in\s+([A-Za-z]+(?:\s+[A-Za-z]+)*)',
+    r'how\s+is\s+(?:the\s+)?weather\s+in\s+([A-Za-z]+(?:\s+[A-Za-z]+)*)',
+    r'([A-Za-z]+(?:\s+[A-Za-z]+)*)\s+weather',
     
-    "Stay informed during emergencies by:\n• Having multiple information sources (NOAA weather radio, mobile alerts)\n• Following local emergency management agencies on social media\n• Downloading emergency apps from FEMA, Red Cross, and local agencies\n• Understanding warning systems in your community\n• Keeping backup power sources for communication devices",
+    # Travel safety patterns
+    r'(?:travel|drive|driving|commute)\s+(?:to|in|through|around|near)\s+([A-Za-z]+(?:\s+[A-Za-z]+)*)',
+    r'(?:safe|safety|conditions)\s+(?:to|in|for)\s+(?:travel|drive|commute|go)\s+(?:to|in|through|around|near)\s+([A-Za-z]+(?:\s+[A-Za-z]+)*)',
+    r'(?:safe|safety|conditions)\s+(?:in|for|of|at)\s+([A-Za-z]+(?:\s+[A-Za-z]+)*)',
     
-    "Critical documents for emergency preparedness:\n• Store in waterproof, portable containers: insurance policies, identification\n• Include medical information, property records and financial documents\n• Consider cloud storage backup for digital copies\n• Have emergency contact lists for family, neighbors, and important services\n• Include maps of your area with evacuation routes marked",
+    # Road/route patterns
+    r'(?:road|route|traffic|highway)\s+(?:condition|status)\s+(?:in|to|near|around)\s+([A-Za-z]+(?:\s+[A-Za-z]+)*)',
     
-    "Building emergency resilience means:\n• Learning basic life-saving skills like CPR and first aid\n• Knowing how to operate fire extinguishers and when to use them\n• Understanding how to purify water if supplies are contaminated\n• Being able to safely use backup heating and power sources\n• Creating emergency plans for different scenarios (home fires, natural disasters)"
+    # General location patterns (must be last to avoid false positives)
+    r'(?:in|at|to|from|near)\s+([A-Za-z]+(?:\s+[A-Za-z]+)*)'
 ]
 
-# Enhanced greetings and farewell responses
-GREETINGS = [
-    "Hello! I'm your Weather Preparedness Assistant. I provide current weather data, safety tips, travel recommendations, and alternative action suggestions based on conditions in your area. How can I help you stay safe today?",
-    
-    "Hi there! I'm your Weather Safety Assistant. Ask me about weather conditions in any city, and I'll give you detailed safety information, travel advisories, and recommended actions based on current conditions. What would you like to know?",
-    
-    "Welcome to the Weather Preparedness Assistant! I can assess weather safety, provide travel recommendations, and suggest appropriate actions for any location. Try asking 'Is it safe to travel in [city]?' or 'What's the weather in [city]?'"
-]
+# Words to be excluded from city names - these common words, time references
+# and modal words should not be part of the city name
+EXCLUDED_WORDS = frozenset([
+    # Common words
+    'the', 'there', 'here', 'this', 'that', 'these', 'those', 'outside', 'inside', 
+    'general', 'currently', 'presently', 'such', 'going', 'like', 'have', 'has',
+    # Time references that often appear in queries
+    'today', 'tomorrow', 'yesterday', 'morning', 'afternoon', 'evening', 'night', 
+    'now', 'later', 'current', 'present', 'soon', 'moment', 'future', 'past',
+    # Modal verbs and question words
+    'should', 'would', 'could', 'can', 'may', 'might', 'must', 'shall', 'will',
+    'who', 'what', 'when', 'where', 'why', 'how',
+    # Travel verbs that the general location pattern can pick up ("safe to drive")
+    'drive', 'driving', 'travel', 'traveling', 'commute', 'go'
+])
 
-FAREWELLS = [
-    "Stay safe and weather-aware! Remember to check forecasts regularly and have your emergency plans updated. Feel free to ask if you have more questions in the future.",
-    
-    "Thanks for chatting! I'm always here to help with weather safety information and updates. Remember that preparedness is key to staying safe in any weather condition.",
-    
-    "I hope that information helps keep you safe! Weather can change quickly, so stay informed through multiple alert systems. Come back anytime for more weather safety guidance."
+WEATHER_RELATED_TERMS = ['weather', 'temperature', 'how is', "what's", 'forecast', 'conditions', 'raining', 'snowing']
+TRAVEL_RELATED_TERMS = [
+    'travel', 'drive', 'driving', 'road', 'trip', 'commute', 'journey', 'safe to', 'should i go',
+    'commuting', 'traffic', 'roads', 'drive to', 'drive in', 'driving to', 'driving in',
+    'travel to', 'travel in', 'traveling to', 'traveling in', 'safe for driving',
+    'should i drive', 'can i drive', 'ok to drive', 'okay to drive', 'alright to drive'
 ]
 
-# Enhanced unknown response fallbacks
-UNKNOWN_RESPONSES = [
-    "I'm not sure I understood your question. I can provide weather safety information, travel recommendations, and alternative action suggestions for any location. Try asking 'Is it safe to travel in [city]?' or 'What's the weather in [city]?'",
-    
-    "I didn't quite catch that. For best results, ask me about weather conditions and travel safety in specific locations. I can tell you if it's safe to travel and what precautions to take based on current weather conditions.",
-    
-    "I'm designed to provide weather-based safety recommendations. Try asking something like 'Should I drive in Chicago today?' or 'What's the weather in Miami?' to get detailed safety tips, travel advisories, and suggested actions."
-]
+# Follow-up questions that refer back to the previous city, e.g.
+# "is it safe to drive there?"
+FOLLOW_UP_PATTERN = re.compile(r'\b(?:there|that city|the same city)\W*$', re.IGNORECASE)
+
+# Per-process cache of each conversation's last weather snapshot. The city
+# itself lives in the caller's session, so any worker can resolve follow-ups.
+conversation_store = ConversationStore(
+    max_sessions=int(os.environ.get("CONVERSATION_MAX_SESSIONS", "10000")),
+    ttl=int(os.environ.get("CONVERSATION_TTL", "1800"))
+)
+# Seconds a remembered weather snapshot is served before it is fetched again
+SNAPSHOT_MAX_AGE = int(os.environ.get("CONVERSATION_SNAPSHOT_MAX_AGE", "600"))
+
+# Concurrent upstream fetches per batch request
+BATCH_FETCH_WORKERS = int(os.environ.get("CHATBOT_BATCH_FETCH_WORKERS", "8"))
+# Distinct cities one batch may fetch, since each one is an upstream call
+BATCH_MAX_CITIES = int(os.environ.get("CHATBOT_BATCH_MAX_CITIES", "25"))
+
+class BatchTooLargeError(Exception):
+    """Raised when a batch would need too many upstream calls."""
+
+@lru_cache(maxsize=None)
+def _compiled_city_patterns():
+    """Compile CITY_PATTERNS once, on first use."""
+    return tuple(re.compile(pattern, re.IGNORECASE) for pattern in CITY_PATTERNS)
+
+def warmup():
+    """
+    Compile the extraction patterns so the first real request does not pay
+    for it. Gunicorn's master calls this after preloading the app, so workers
+    share the compiled patterns.
+    """
+    _compiled_city_patterns()
+    get_city_from_text("What's the weather in London?")
 
 def get_city_from_text(text):
     """
@@ -113,56 +104,22 @@ def get_city_from_text(text):
     # Log the original text
     logger.debug(f"Extracting city from: {text}")
     
-    # Enhanced patterns to handle both weather and travel queries
-    city_patterns = [
-        # Weather patterns
-        r'weather\s+in\s+([A-Za-z]+(?:\s+[A-Za-z]+)*)',
-        r'what(?:\'s|\s+is)\s+(?:the\s+)?weather\s+in\s+([A-Za-z]+(?:\s+[A-Za-z]+)*)',
-        r'how\s+is\s+(?:the\s+)?weather\s+in\s+([A-Za-z]+(?:\s+[A-Za-z]+)*)',
-        r'([A-Za-z]+(?:\s+[A-Za-z]+)*)\s+weather',
-        
-        # Travel safety patterns
-        r'(?:travel|drive|driving|commute)\s+(?:to|in|through|around|near)\s+([A-Za-z]+(?:\s+[A-Za-z]+)*)',
-        r'(?:safe|safety|conditions)\s+(?:to|in|for)\s+(?:travel|drive|commute|go)\s+(?:to|in|through|around|near)\s+([A-Za-z]+(?:\s+[A-Za-z]+)*)',
-        r'(?:safe|safety|conditions)\s+(?:in|for|of|at)\s+([A-Za-z]+(?:\s+[A-Za-z]+)*)',
-        
-        # Road/route patterns
-        r'(?:road|route|traffic|highway)\s+(?:condition|status)\s+(?:in|to|near|around)\s+([A-Za-z]+(?:\s+[A-Za-z]+)*)',
-        
-        # General location patterns (must be last to avoid false positives)
-        r'(?:in|at|to|from|near)\s+([A-Za-z]+(?:\s+[A-Za-z]+)*)'
-    ]
-    
-    # Words to be excluded from city names - these common words, time references
-    # and modal words should not be part of the city name
-    excluded_words = [
-        # Common words
-        'the', 'there', 'here', 'this', 'that', 'these', 'those', 'outside', 'inside', 
-        'general', 'currently', 'presently', 'such', 'going', 'like', 'have', 'has',
-        # Time references that often appear in queries
-        'today', 'tomorrow', 'yesterday', 'morning', 'afternoon', 'evening', 'night', 
-        'now', 'later', 'current', 'present', 'soon', 'moment', 'future', 'past',
-        # Modal verbs and question words
-        'should', 'would', 'could', 'can', 'may', 'might', 'must', 'shall', 'will',
-        'who', 'what', 'when', 'where', 'why', 'how'
-    ]
-    
     # Use original case-preserving text for extraction
-    for pattern in city_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
+    for pattern in _compiled_city_patterns():
+        match = pattern.search(text)
         if match:
             # Get the potential city name
             raw_city = match.group(1).strip()
             
             # Skip if the entire extracted text is in our excluded words list
-            if raw_city.lower() in excluded_words:
+            if raw_city.lower() in EXCLUDED_WORDS:
                 continue
             
             # Split the city name into words
             city_words = raw_city.split()
             
             # Filter out excluded words from the city name
-            filtered_city_words = [word for word in city_words if word.lower() not in excluded_words]
+            filtered_city_words = [word for word in city_words if word.lower() not in EXCLUDED_WORDS]
             
             # If we have no words left after filtering, continue to next pattern
             if not filtered_city_words:
@@ -420,13 +377,115 @@ def format_weather_response(data):
         logger.error(f"Error formatting weather response: {str(e)}")
         return "Sorry, I had trouble formatting the weather information. Please try again."
 
-def get_chatbot_response(user_input):
+def classify_weather(data):
+    """
+    Classify weather data into a hazard category for travel decisions.
+    
+    Args:
+        data (dict): Weather data as returned by get_weather_data, or an Observation.
+        
+    Returns:
+        dict: The weather condition and whether travel is considered safe.
+    """
+    weather_condition = "normal"
+    description = data['description'].lower()
+    temp = data['temperature']
+    wind_speed = data['wind_speed']
+    is_travel_safe = True
+    
+    # Determine the weather condition category - similar logic as in format_weather_response
+    if 'rain' in description or 'drizzle' in description or 'shower' in description:
+        weather_condition = "rain"
+        if 'heavy' in description or 'thunderstorm' in description:
+            is_travel_safe = False
+    elif 'snow' in description or 'blizzard' in description:
+        weather_condition = "snow"
+        if 'blizzard' in description or 'heavy' in description:
+            is_travel_safe = False
+    elif 'storm' in description or 'thunder' in description:
+        weather_condition = "storm"
+        is_travel_safe = False
+    elif 'fog' in description or 'mist' in description:
+        weather_condition = "fog"
+        if 'dense' in description or 'thick' in description:
+            is_travel_safe = False
+    elif temp > 35:
+        weather_condition = "extreme heat"
+        is_travel_safe = False
+    elif temp < -10:
+        weather_condition = "extreme cold"
+        is_travel_safe = False
+    elif wind_speed > 20:
+        weather_condition = "high winds"
+        is_travel_safe = False
+    
+    return {'condition': weather_condition, 'is_travel_safe': is_travel_safe}
+
+def format_travel_response(weather_data, hazard):
+    """
+    Wrap the weather response in a travel safety assessment.
+    
+    Args:
+        weather_data (dict): Weather data as returned by get_weather_data, or an Observation.
+        hazard (dict): Classification as returned by classify_weather.
+        
+    Returns:
+        str: The travel-focused response.
+    """
+    response = format_weather_response(weather_data)
+    weather_condition = hazard['condition']
+    
+    # Create a special introduction for travel safety queries
+    travel_intro = f"**🚗 TRAVEL SAFETY ASSESSMENT FOR {weather_data['location'].upper()} 🚗**\n\n"
+    travel_intro += f"You asked about travel safety in {weather_data['location']}. Based on current weather conditions, here is my assessment:\n\n"
+    
+    if hazard['is_travel_safe']:
+        travel_intro += f"✅ **TRAVEL IS GENERALLY SAFE** under the current {weather_condition} conditions.\n\n"
+    else:
+        travel_intro += f"⚠️ **TRAVEL IS NOT RECOMMENDED** due to {weather_condition} conditions.\n\n"
+    
+    travel_intro += "Below is the detailed weather information and safety recommendations:\n\n"
+    
+    # Add conclusion
+    travel_conclusion = "\n**Additional Travel Advice**:\n"
+    travel_conclusion += "• Check local traffic reports before departing\n"
+    travel_conclusion += "• Ensure your vehicle is properly maintained\n"
+    travel_conclusion += "• Share your travel plans with someone if conditions are concerning\n"
+    travel_conclusion += "• Monitor weather changes throughout your journey\n"
+    
+    return travel_intro + response + travel_conclusion
+
+def _query_kind(user_input_lower):
+    """Returns whether a lowercased message asks about weather and about travel."""
+    is_weather_query = any(term in user_input_lower for term in WEATHER_RELATED_TERMS)
+    is_travel_query = any(term in user_input_lower for term in TRAVEL_RELATED_TERMS)
+    return is_weather_query, is_travel_query
+
+def _format_city_response(weather_data, hazard, is_travel_query):
+    # If it's specifically about travel safety, create a more travel-focused response
+    with span('formatting'):
+        if is_travel_query:
+            return format_travel_response(weather_data, hazard)
+        else:
+            return format_weather_response(weather_data)
+
+def _city_error_response(city):
+    return f"I'm sorry, I couldn't retrieve the weather information for {city}. Please check if the city name is correct or try again later."
+
+def get_chatbot_response(user_input, session=None):
     """
     Generate a response to the user's input based on weather-related keywords,
     providing safety information and travel recommendations.
     
+    When a session is given, the last city asked about is stored in it, so
+    follow-ups such as "is it safe to drive there?" reuse it instead of asking
+    for the city again. The weather snapshot for that city is cached in this
+    process under the session's conversation_id.
+    
     Args:
         user_input (str): The user's message to the chatbot.
+        session (dict): Optional mutable conversation session, such as the
+            Flask session.
         
     Returns:
         str: The chatbot's response with safety recommendations.
@@ -437,90 +496,51 @@ def get_chatbot_response(user_input):
     # Convert input to lowercase for easier matching
     user_input_lower = user_input.lower()
     
-    # Check if this is a weather or travel safety query for a specific city
-    city = get_city_from_text(user_input)
-    weather_related_terms = ['weather', 'temperature', 'how is', "what's", 'forecast', 'conditions', 'raining', 'snowing']
-    travel_related_terms = [
-        'travel', 'drive', 'driving', 'road', 'trip', 'commute', 'journey', 'safe to', 'should i go',
-        'commuting', 'traffic', 'roads', 'drive to', 'drive in', 'driving to', 'driving in',
-        'travel to', 'travel in', 'traveling to', 'traveling in', 'safe for driving',
-        'should i drive', 'can i drive', 'ok to drive', 'okay to drive', 'alright to drive'
-    ]
-    
-    if city:
-        # Check if it's a weather or travel-related query
-        is_weather_query = any(term in user_input_lower for term in weather_related_terms)
-        is_travel_query = any(term in user_input_lower for term in travel_related_terms)
-        
-        if is_weather_query or is_travel_query:
-            try:
-                logger.debug(f"Detected weather/travel query for city: {city}")
-                weather_data = get_weather_data(city, api_key=OPENWEATHER_API_KEY)
-                
-                # If it's specifically about travel safety, create a more travel-focused response
-                response = format_weather_response(weather_data)
-                
-                if is_travel_query:
-                    # Extract key information from the response for a more concise travel summary
-                    weather_condition = "normal"
-                    description = weather_data['description'].lower()
-                    temp = weather_data['temperature']
-                    wind_speed = weather_data['wind_speed']
-                    is_travel_safe = True
-                    
-                    # Determine the weather condition category - similar logic as in format_weather_response
-                    if 'rain' in description or 'drizzle' in description or 'shower' in description:
-                        weather_condition = "rain"
-                        if 'heavy' in description or 'thunderstorm' in description:
-                            is_travel_safe = False
-                    elif 'snow' in description or 'blizzard' in description:
-                        weather_condition = "snow"
-                        if 'blizzard' in description or 'heavy' in description:
-                            is_travel_safe = False
-                    elif 'storm' in description or 'thunder' in description:
-                        weather_condition = "storm"
-                        is_travel_safe = False
-                    elif 'fog' in description or 'mist' in description:
-                        weather_condition = "fog"
-                        if 'dense' in description or 'thick' in description:
-                            is_travel_safe = False
-                    elif temp > 35:
-                        weather_condition = "extreme heat"
-                        is_travel_safe = False
-                    elif temp < -10:
-                        weather_condition = "extreme cold"
-                        is_travel_safe = False
-                    elif wind_speed > 20:
-                        weather_condition = "high winds"
-                        is_travel_safe = False
-                    
-                    # Create a special introduction for travel safety queries
-                    travel_intro = f"**🚗 TRAVEL SAFETY ASSESSMENT FOR {weather_data['location'].upper()} 🚗**\n\n"
-                    travel_intro += f"You asked about travel safety in {weather_data['location']}. Based on current weather conditions, here is my assessment:\n\n"
-                    
-                    if is_travel_safe:
-                        travel_intro += f"✅ **TRAVEL IS GENERALLY SAFE** under the current {weather_condition} conditions.\n\n"
-                    else:
-                        travel_intro += f"⚠️ **TRAVEL IS NOT RECOMMENDED** due to {weather_condition} conditions.\n\n"
-                    
-                    travel_intro += "Below is the detailed weather information and safety recommendations:\n\n"
-                    
-                    # Add conclusion
-                    travel_conclusion = "\n**Additional Travel Advice**:\n"
-                    travel_conclusion += "• Check local traffic reports before departing\n"
-                    travel_conclusion += "• Ensure your vehicle is properly maintained\n"
-                    travel_conclusion += "• Share your travel plans with someone if conditions are concerning\n"
-                    travel_conclusion += "• Monitor weather changes throughout your journey\n"
-                    
-                    return travel_intro + response + travel_conclusion
-                else:
-                    return response
-            except Exception as e:
-                logger.error(f"Error getting weather data: {str(e)}")
-                return f"I'm sorry, I couldn't retrieve the weather information for {city}. Please check if the city name is correct or try again later."
+    is_weather_query, is_travel_query = _query_kind(user_input_lower)
+    
+    # Check if this is a weather or travel safety query for a specific city,
+    # falling back to the city from earlier in the conversation
+    with span('extraction'):
+        city = get_city_from_text(user_input)
+    remembered_city = session.get('city') if session is not None else None
+    if not city and remembered_city:
+        if FOLLOW_UP_PATTERN.search(user_input):
+            city = remembered_city
+            is_weather_query = True
+        elif is_travel_query or 'weather' in user_input_lower:
+            city = remembered_city
+    
+    session_id = session.get('conversation_id') if session is not None else None
+    state = conversation_store.get(session_id)
     
+    if city and (is_weather_query or is_travel_query):
+        try:
+            logger.debug(f"Detected weather/travel query for city: {city}")
+            if (state and state['city'].lower() == city.lower()
+                    and conversation_store.is_fresh(state, SNAPSHOT_MAX_AGE)):
+                logger.debug(f"Reusing weather snapshot for {city} from conversation state")
+                weather_data = state['weather']
+                hazard = state['hazard']
+            else:
+                with span('fetch'):
+                    weather_data = fetch_observation(city, api_key=OPENWEATHER_API_KEY)
+                with span('classification'):
+                    hazard = classify_weather(weather_data)
+                conversation_store.remember(session_id, city, weather_data, hazard)
+            if session is not None:
+                session['city'] = city
+            
+            return _format_city_response(weather_data, hazard, is_travel_query)
+        except Exception as e:
+            logger.error(f"Error getting weather data: {str(e)}")
+            return _city_error_response(city)
+    
+    return _general_response(user_input_lower)
+
+def _general_response(user_input_lower):
+    """Answer a message that is not a weather or travel question about a city."""
     # Handle travel-related queries without a specific city
-    if any(term in user_input_lower for term in travel_related_terms):
+    if any(term in user_input_lower for term in TRAVEL_RELATED_TERMS):
         return "To provide travel safety recommendations, I need to know your location. Please ask about travel safety for a specific city, for example: 'Is it safe to travel in Chicago?' or 'What are the travel conditions in New York?'"
     
     # Check for greetings
@@ -552,3 +572,67 @@ def get_chatbot_response(user_input):
     
     # Default response if nothing matches
     return random.choice(UNKNOWN_RESPONSES)
+
+def get_chatbot_responses(messages):
+    """
+    Generate responses for a batch of independent messages.
+    
+    Cities are extracted from every message first, each distinct city is
+    fetched once (concurrently), and every reply is rendered from the shared
+    data, so many messages about the same few cities cost only a few upstream
+    calls. Messages are answered without conversation state.
+    
+    Args:
+        messages (list): The user messages.
+        
+    Returns:
+        list: The chatbot's responses, in the same order as messages.
+        
+    Raises:
+        BatchTooLargeError: If the messages name more than BATCH_MAX_CITIES cities.
+    """
+    logger.debug(f"Chatbot received a batch of {len(messages)} messages")
+    
+    # 1. Work out which messages need weather for which city
+    plans = []
+    cities = {}
+    for user_input in messages:
+        user_input_lower = user_input.lower()
+        is_weather_query, is_travel_query = _query_kind(user_input_lower)
+        with span('extraction'):
+            city = get_city_from_text(user_input)
+        if city and not (is_weather_query or is_travel_query):
+            city = None
+        if city:
+            cities.setdefault(city.lower(), city)
+        plans.append((user_input_lower, city, is_travel_query))
+    
+    if len(cities) > BATCH_MAX_CITIES:
+        raise BatchTooLargeError(f"At most {BATCH_MAX_CITIES} different cities are allowed per batch")
+    
+    # 2. Fetch each distinct city once
+    fetched = {}
+    if cities:
+        with span('fetch'), ThreadPoolExecutor(max_workers=min(BATCH_FETCH_WORKERS, len(cities))) as executor:
+            futures = {key: executor.submit(fetch_observation, city, api_key=OPENWEATHER_API_KEY)
+                       for key, city in cities.items()}
+            for key, future in futures.items():
+                try:
+                    fetched[key] = future.result()
+                except Exception as e:
+                    logger.error(f"Error getting weather data: {str(e)}")
+    with span('classification'):
+        weather = {key: (weather_data, classify_weather(weather_data)) for key, weather_data in fetched.items()}
+    logger.debug(f"Fetched weather for {len(cities)} distinct cities")
+    
+    # 3. Render every reply from the shared data
+    responses = []
+    for user_input_lower, city, is_travel_query in plans:
+        if city is None:
+            responses.append(_general_response(user_input_lower))
+        elif city.lower() in weather:
+            weather_data, hazard = weather[city.lower()]
+            responses.append(_format_city_response(weather_data, hazard, is_travel_query))
+        else:
+            responses.append(_city_error_response(city))
+    return responses
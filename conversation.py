@@ -0,0 +1,117 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+class ConversationStore:
+    """
+    In-memory cache of conversation state for the chatbot, keyed by session id.
+
+    The city a conversation is about is also kept in the client's session, so
+    this store is only a per-process cache that saves refetching the weather.
+    Each session keeps a fixed set of fields (the resolved city, the last
+    weather snapshot, when it was fetched and its hazard classification), so
+    memory per session is bounded. The store holds at most max_sessions
+    sessions, evicting the least recently used, and forgets sessions idle for
+    longer than ttl seconds.
+    """
+
+    def __init__(self, max_sessions=10000, ttl=1800, clock=time.monotonic):
+        """
+        Args:
+            max_sessions (int): Maximum number of sessions kept in memory.
+            ttl (float): Seconds of inactivity after which a session expires.
+            clock (callable): Returns the current time in seconds.
+        """
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._clock = clock
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        """
+        Returns the state for a session, or None if it is unknown or expired.
+
+        Args:
+            session_id (str): The conversation's session id.
+
+        Returns:
+            dict: A copy of the session state.
+        """
+        if not session_id:
+            return None
+        now = self._clock()
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is None:
+                return None
+            if now - state['touched_at'] > self.ttl:
+                del self._sessions[session_id]
+                return None
+            state['touched_at'] = now
+            self._sessions.move_to_end(session_id)
+            return dict(state)
+
+    def remember(self, session_id, city, weather_data, hazard):
+        """
+        Records the city, weather snapshot and hazard classification from the
+        latest answered weather question.
+
+        Args:
+            session_id (str): The conversation's session id.
+            city (str): The city the user asked about.
+            weather_data (Observation): The weather snapshot for the city.
+            hazard (dict): Classification as returned by classify_weather.
+        """
+        if not session_id:
+            return
+        now = self._clock()
+        # Data replayed from the upstream archive can be older than this call
+        age = max(0.0, time.time() - weather_data.observed_at)
+        with self._lock:
+            self._sessions[session_id] = {
+                'city': city,
+                'weather': weather_data,
+                'hazard': hazard,
+                'fetched_at': now - age,
+                'touched_at': now
+            }
+            self._sessions.move_to_end(session_id)
+            self._evict(now)
+
+    def forget(self, session_id):
+        """Drops any state held for a session."""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def is_fresh(self, state, max_age):
+        """
+        Checks whether a session's weather snapshot is recent enough to reuse.
+
+        Args:
+            state (dict): State as returned by get.
+            max_age (float): Maximum snapshot age in seconds.
+
+        Returns:
+            bool: True if the snapshot can be served without a new fetch.
+        """
+        return state is not None and self._clock() - state['fetched_at'] <= max_age
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def _evict(self, now):
+        # Expired sessions sit at the front because entries are kept in
+        # least-recently-used order
+        while self._sessions:
+            session_id, state = next(iter(self._sessions.items()))
+            if now - state['touched_at'] <= self.ttl and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[session_id]
+            logger.debug(f"Evicted conversation state for session {session_id}")
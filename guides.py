@@ -0,0 +1,118 @@
+"""
+Precomputed safety guide documents for /api/guides.
+
+Every hazard guide from chatbot_responses is serialized once, compressed ahead
+of time with gzip (and brotli when the optional brotli package is installed),
+and tagged with a content hash. Requests only pick the stored body that matches
+the client's Accept-Encoding, so they do no serialization or compression work.
+"""
+import gzip
+import json
+import hashlib
+import logging
+import threading
+
+import chatbot_responses
+
+try:
+    import brotli
+except ImportError:  # Optional, gzip is always available
+    brotli = None
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Guide names that are not weather hazards, mapped to their response table
+EXTRA_GUIDES = {'general': 'GENERAL_TIPS'}
+
+class StaticDocument:
+    """A JSON document stored in every supported encoding, with its ETags."""
+
+    __slots__ = ('digest', 'bodies')
+
+    def __init__(self, data):
+        """
+        Args:
+            data: JSON-serializable content of the document.
+        """
+        identity = json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        self.digest = hashlib.sha256(identity).hexdigest()[:16]
+        self.bodies = {'identity': identity, 'gzip': gzip.compress(identity, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.bodies['br'] = brotli.compress(identity, quality=11)
+
+    def etag(self, encoding):
+        """
+        Returns:
+            str: The quoted strong ETag for the body in the given encoding.
+        """
+        return f'"{self.digest}"' if encoding == 'identity' else f'"{self.digest}-{encoding}"'
+
+    def negotiate(self, accept_encoding):
+        """
+        Picks the smallest stored body the client accepts. A coding given
+        with q=0 is refused, even when the client also sends *.
+
+        Args:
+            accept_encoding (str): The request's Accept-Encoding header.
+
+        Returns:
+            tuple: The encoding name and the body bytes.
+        """
+        accepted, refused = set(), set()
+        for part in (accept_encoding or '').lower().split(','):
+            coding, _, params = part.partition(';')
+            params = params.replace(' ', '')
+            try:
+                quality = float(params[2:]) if params.startswith('q=') else 1.0
+            except ValueError:
+                quality = 0.0
+            if quality > 0:
+                accepted.add(coding.strip())
+            else:
+                refused.add(coding.strip())
+        for encoding in ('br', 'gzip'):
+            if encoding in self.bodies and encoding not in refused and (encoding in accepted or '*' in accepted):
+                return encoding, self.bodies[encoding]
+        return 'identity', self.bodies['identity']
+
+def build_guides():
+    """
+    Builds one document per hazard guide and an index of all of them.
+
+    Returns:
+        dict: The 'index' document and a 'guides' dict of StaticDocument by name.
+    """
+    tables = {hazard: responses for hazard, responses in chatbot_responses.WEATHER_RESPONSES.items()}
+    for name, table in EXTRA_GUIDES.items():
+        tables[name] = getattr(chatbot_responses, table)
+
+    documents = {name: StaticDocument({'hazard': name, 'guides': list(guides)})
+                 for name, guides in tables.items()}
+    index = StaticDocument({
+        'guides': {
+            name: {'url': f"/api/guides/{name}/{document.digest}", 'etag': document.digest}
+            for name, document in documents.items()
+        }
+    })
+    logger.debug(f"Built {len(documents)} safety guides with encodings {', '.join(index.bodies)}")
+    return {'index': index, 'guides': documents}
+
+_guides = None
+_build_lock = threading.Lock()
+
+def get_guides():
+    """
+    Returns the precomputed guides, building them on first call. Gunicorn's
+    master calls this after preloading the app, so workers share one copy.
+
+    Returns:
+        dict: As returned by build_guides.
+    """
+    global _guides
+    if _guides is None:
+        with _build_lock:
+            if _guides is None:
+                _guides = build_guides()
+    return _guides
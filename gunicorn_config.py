@@ -0,0 +1,34 @@
+"""
+Production gunicorn settings.
+
+Usage:
+    gunicorn -c gunicorn_config.py main:app
+
+The app is imported once in the master, which then runs app.preload() to build
+the compiled patterns and guide documents. Workers are forked from it, so all
+of this is shared copy-on-write. Each worker then runs app.warmup() before it
+accepts connections.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "30"))
+# Threaded workers. Every open /api/live stream holds one thread until the
+# client disconnects, so threads must cover LIVE_MAX_STREAMS (default 32) plus
+# headroom for regular requests
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "64"))
+reuse_port = True
+preload_app = True
+
+def when_ready(server):
+    """Build shared read-only state in the master so workers share it."""
+    from app import preload
+    preload()
+
+def post_worker_init(worker):
+    """Warm the worker before it joins the pool."""
+    from app import warmup
+    warmup()
@@ -0,0 +1,263 @@
+"""
+Live weather subscriptions delivered as Server-Sent Events.
+
+Each subscribed location has a single refresh loop, however many clients are
+watching it. When a refresh changes anything, only the changed fields are
+encoded, once, as a delta event and fanned out to every subscriber, so server
+work follows how often the weather changes rather than how many clients poll.
+"""
+import json
+import queue
+import logging
+import threading
+
+from weather_api import fetch_observation, fetch_forecast_series
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Fields that change on every fetch without the weather changing. They are
+# only sent along with other changes.
+VOLATILE_FIELDS = frozenset(['timestamp'])
+
+def _encode(event, data):
+    payload = json.dumps(data, separators=(',', ':'))
+    return f"event: {event}\ndata: {payload}\n\n"
+
+def diff(old, new):
+    """
+    Returns the fields of new that differ from old, skipping VOLATILE_FIELDS.
+
+    Args:
+        old (dict): The previous snapshot.
+        new (dict): The latest snapshot.
+
+    Returns:
+        dict: Changed or added fields with their new values.
+    """
+    return {key: value for key, value in new.items()
+            if key not in VOLATILE_FIELDS and old.get(key) != value}
+
+class LiveCapacityError(Exception):
+    """Raised when a subscription would start more refresh loops than allowed."""
+
+class Subscription:
+    """One client's stream of encoded events for a set of locations."""
+
+    def __init__(self, hub, locations, max_pending=100):
+        self.hub = hub
+        self.locations = locations
+        self._events = queue.Queue(maxsize=max_pending)
+        self._push_lock = threading.Lock()
+
+    def push(self, event):
+        """
+        Queues an encoded event. If the client has fallen too far behind, its
+        pending events are dropped and replaced by a fresh snapshot of every
+        location it subscribed to.
+
+        Args:
+            event (str): The encoded event.
+        """
+        # Feed threads push concurrently, so overflow handling is serialized
+        with self._push_lock:
+            try:
+                self._events.put_nowait(event)
+                return
+            except queue.Full:
+                pass
+            while True:
+                try:
+                    self._events.get_nowait()
+                except queue.Empty:
+                    break
+            for snapshot in self.hub.snapshot_events(self.locations):
+                try:
+                    self._events.put_nowait(snapshot)
+                except queue.Full:
+                    logger.warning(f"Live subscription queue too small to resync {', '.join(self.locations)}")
+                    break
+
+    def events(self, heartbeat=15):
+        """
+        Yields encoded events until the client disconnects, with a comment
+        line every heartbeat seconds to keep idle connections open.
+        """
+        try:
+            while True:
+                try:
+                    yield self._events.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            self.hub.unsubscribe(self)
+
+class LocationFeed:
+    """
+    The refresh loop and latest snapshot for one location. The first refresh
+    is sent as a delta from an empty snapshot, so clients can simply merge
+    every delta into what they have.
+    """
+
+    def __init__(self, hub, location):
+        self.hub = hub
+        self.location = location
+        self.snapshot = {}
+        self.version = 0
+        self.failures = 0
+        self.subscribers = set()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"live-{location}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def snapshot_event(self):
+        return _encode('snapshot', {'location': self.location, 'version': self.version, 'data': self.snapshot})
+
+    def refresh(self, include_forecast):
+        """
+        Fetches the location and returns the encoded delta event, or None if
+        nothing changed.
+        """
+        latest = fetch_observation(self.location, api_key=self.hub.api_key).to_dict()
+        if include_forecast:
+            latest['forecast'] = fetch_forecast_series(self.location, api_key=self.hub.api_key).to_dict()['forecast']
+        with self.hub.lock:
+            changes = diff(self.snapshot, latest)
+            self.snapshot = {**self.snapshot, **latest}
+            if not changes:
+                return None
+            # Say how old the changed data is, it may come from the archive
+            changes['timestamp'] = latest['timestamp']
+            self.version += 1
+            return _encode('delta', {'location': self.location, 'version': self.version, 'changes': changes})
+
+    def _run(self):
+        refreshes = 0
+        forecast_every = max(1, round(self.hub.forecast_interval / self.hub.interval))
+        while not self._stop.is_set():
+            try:
+                event = self.refresh(include_forecast=refreshes % forecast_every == 0)
+                self.failures = 0
+            except Exception as e:
+                logger.error(f"Error refreshing live weather for {self.location}: {str(e)}")
+                self.failures += 1
+                retrying = self.failures < self.hub.max_failures
+                event = _encode('error', {'location': self.location, 'error': str(e), 'retrying': retrying})
+                if not retrying:
+                    # Give up on locations that keep failing, e.g. unknown cities
+                    self.hub.drop_feed(self)
+            refreshes += 1
+            if event is not None:
+                with self.hub.lock:
+                    subscribers = list(self.subscribers)
+                for subscription in subscribers:
+                    subscription.push(event)
+            self._stop.wait(self.hub.interval)
+
+class LiveWeatherHub:
+    """Multiplexes all subscribers onto one refresh loop per location."""
+
+    def __init__(self, api_key, interval=60, forecast_interval=600, max_pending=100,
+                 max_feeds=100, max_subscriptions=32, max_failures=3):
+        """
+        Args:
+            api_key (str): OpenWeatherMap API key.
+            interval (float): Seconds between current weather refreshes.
+            forecast_interval (float): Seconds between forecast refreshes.
+            max_pending (int): Events queued per client before it is resynced.
+            max_feeds (int): Locations refreshed at once in this process.
+            max_subscriptions (int): Open streams in this process. Each one holds
+                a server thread for as long as the client stays connected.
+            max_failures (int): Consecutive failed refreshes before a location is dropped.
+        """
+        self.api_key = api_key
+        self.interval = interval
+        self.forecast_interval = forecast_interval
+        self.max_pending = max_pending
+        self.max_feeds = max_feeds
+        self.max_subscriptions = max_subscriptions
+        self.max_failures = max_failures
+        # Reentrant, because a subscriber resync reads snapshots under this lock
+        self.lock = threading.RLock()
+        self._feeds = {}
+        self._subscriptions = 0
+
+    def subscribe(self, locations):
+        """
+        Subscribes to a set of locations. The subscription starts with the
+        latest snapshot of each location that has already been fetched.
+
+        Args:
+            locations (list): Location names.
+
+        Returns:
+            Subscription: The new subscription.
+
+        Raises:
+            LiveCapacityError: If the process already has max_subscriptions open
+                streams, or the new locations would exceed max_feeds.
+        """
+        locations = list(dict.fromkeys(location.strip().lower() for location in locations if location.strip()))
+        subscription = Subscription(self, locations, self.max_pending)
+        with self.lock:
+            if self._subscriptions >= self.max_subscriptions:
+                raise LiveCapacityError(f"Live updates are limited to {self.max_subscriptions} streams at a time")
+            new_feeds = [location for location in locations if location not in self._feeds]
+            if len(self._feeds) + len(new_feeds) > self.max_feeds:
+                raise LiveCapacityError(f"Live updates are limited to {self.max_feeds} locations at a time")
+            self._subscriptions += 1
+            for location in subscription.locations:
+                feed = self._feeds.get(location)
+                if feed is None:
+                    feed = self._feeds[location] = LocationFeed(self, location)
+                    feed.start()
+                elif feed.version:
+                    subscription.push(feed.snapshot_event())
+                feed.subscribers.add(subscription)
+        logger.debug(f"Live subscription for {', '.join(subscription.locations)}")
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Removes a subscription, stopping refresh loops nobody watches anymore."""
+        with self.lock:
+            self._subscriptions -= 1
+            for location in subscription.locations:
+                feed = self._feeds.get(location)
+                if feed is None:
+                    continue
+                feed.subscribers.discard(subscription)
+                if not feed.subscribers:
+                    feed.stop()
+                    del self._feeds[location]
+        logger.debug(f"Live subscription ended for {', '.join(subscription.locations)}")
+
+    def drop_feed(self, feed):
+        """Stops a feed and forgets it, so a later subscription starts afresh."""
+        with self.lock:
+            feed.stop()
+            if self._feeds.get(feed.location) is feed:
+                del self._feeds[feed.location]
+
+    def snapshot_events(self, locations):
+        """
+        Returns:
+            list: Snapshot events for those of the locations that have data.
+        """
+        with self.lock:
+            feeds = [self._feeds.get(location) for location in locations]
+            return [feed.snapshot_event() for feed in feeds if feed is not None and feed.version]
+
+    def stats(self):
+        """
+        Returns:
+            dict: Subscriber count and snapshot version for each live location.
+        """
+        with self.lock:
+            return {location: {'subscribers': len(feed.subscribers), 'version': feed.version}
+                    for location, feed in self._feeds.items()}
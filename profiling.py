@@ -0,0 +1,298 @@
+"""
+On-demand request profiling.
+
+A request is profiled when it is picked by the runtime sample rate or when it
+carries an X-Profile header matching ADMIN_TOKEN. Profiled requests get:
+
+- a span breakdown, from span() blocks placed around extraction,
+  classification, fetch, formatting and serialization;
+- stack samples, taken from the request's thread by a background sampler and
+  aggregated as collapsed stacks for flame graphs.
+
+When a request is not profiled, span() returns a shared no-op context manager,
+so the instrumentation costs one context variable lookup.
+
+Settings live in shared memory created at import time. With Gunicorn's
+preload_app, every worker is forked from the master after that, so a change
+made through any worker applies to all of them. Results are kept in memory per
+process, and the admin endpoints report which worker answered.
+"""
+import os
+import sys
+import hmac
+import time
+import random
+import logging
+import threading
+from collections import Counter, deque
+from contextvars import ContextVar
+from multiprocessing import RawValue
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Runtime settings, changed through configure() and shared with forked workers
+_sample_rate = RawValue('d', float(os.environ.get("PROFILE_SAMPLE_RATE", "0")))
+_interval = RawValue('d', float(os.environ.get("PROFILE_INTERVAL", "0.005")))
+
+_current = ContextVar('request_profile', default=None)
+_lock = threading.Lock()
+_stacks = Counter()
+_span_totals = {}
+_recent = deque(maxlen=int(os.environ.get("PROFILE_HISTORY", "200")))
+
+class _NullSpan:
+    """Context manager used when the current request is not profiled."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    __slots__ = ('profile', 'name', 'start')
+
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        self.profile.spans.append((self.name, (self.start - self.profile.start) * 1000, (end - self.start) * 1000))
+        return False
+
+class RequestProfile:
+    """Spans and stack samples collected for one request."""
+
+    def __init__(self, label, thread_id):
+        self.label = label
+        self.thread_id = thread_id
+        self.start = time.perf_counter()
+        self.spans = []
+        self.samples = Counter()
+
+def span(name):
+    """
+    Time a block of work under name when the current request is profiled.
+
+    Usage:
+        with span('formatting'):
+            ...
+    """
+    profile = _current.get()
+    if profile is None:
+        return _NULL_SPAN
+    return _Span(profile, name)
+
+def configure(sample_rate=None, interval=None):
+    """
+    Changes profiling settings at runtime.
+
+    Args:
+        sample_rate (float): Fraction of requests to profile, 0 turns sampling off.
+        interval (float): Seconds between stack samples.
+
+    Returns:
+        dict: The settings now in effect.
+    """
+    if sample_rate is not None:
+        if not 0 <= sample_rate <= 1:
+            raise ValueError("sample_rate must be between 0 and 1")
+        _sample_rate.value = sample_rate
+    if interval is not None:
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        _interval.value = interval
+    return settings()
+
+def settings():
+    """
+    Returns:
+        dict: The sample rate and sampling interval now in effect.
+    """
+    return {'sample_rate': _sample_rate.value, 'interval': _interval.value}
+
+def should_profile(header_value=None):
+    """
+    Decides whether to profile a request.
+
+    Args:
+        header_value (str): Value of the request's X-Profile header, if any.
+
+    Returns:
+        bool: True if the request should be profiled.
+    """
+    if header_value and is_admin(header_value):
+        return True
+    rate = _sample_rate.value
+    return rate > 0 and random.random() < rate
+
+def is_admin(token):
+    """Checks a token against ADMIN_TOKEN. Always False when ADMIN_TOKEN is not set."""
+    expected = os.environ.get("ADMIN_TOKEN")
+    return bool(expected and token) and hmac.compare_digest(token, expected)
+
+def start(label):
+    """
+    Starts profiling the current request on the calling thread.
+
+    Args:
+        label (str): Describes the request, e.g. "POST /api/chatbot".
+
+    Returns:
+        object: Token to pass to finish().
+    """
+    profile = RequestProfile(label, threading.get_ident())
+    _sampler().add(profile)
+    return _current.set(profile)
+
+def finish(token):
+    """
+    Stops profiling the current request and merges its results.
+
+    Returns:
+        dict: The request's span breakdown.
+    """
+    profile = _current.get()
+    _current.reset(token)
+    samples = _sampler().remove(profile)
+    total = (time.perf_counter() - profile.start) * 1000
+    summary = {
+        'request': profile.label,
+        'total_ms': round(total, 3),
+        'spans': [{'name': name, 'start_ms': round(offset, 3), 'duration_ms': round(duration, 3)}
+                  for name, offset, duration in profile.spans],
+        'samples': sum(samples.values())
+    }
+    with _lock:
+        _stacks.update(samples)
+        for name, _, duration in profile.spans:
+            totals = _span_totals.setdefault(name, {'count': 0, 'total_ms': 0.0})
+            totals['count'] += 1
+            totals['total_ms'] += duration
+        _recent.append(summary)
+    return summary
+
+def span_report():
+    """
+    Returns:
+        dict: Per-span totals and averages, and the most recent profiled requests.
+    """
+    with _lock:
+        totals = {name: {'count': t['count'], 'total_ms': round(t['total_ms'], 3),
+                         'avg_ms': round(t['total_ms'] / t['count'], 3)}
+                  for name, t in _span_totals.items()}
+        recent = list(_recent)
+    return {'settings': settings(), 'spans': totals, 'recent': recent}
+
+def collapsed_stacks():
+    """
+    Returns:
+        str: Stack samples in collapsed format, one "frame;frame;frame count"
+        line per stack, as read by flamegraph.pl and speedscope.
+    """
+    with _lock:
+        items = sorted(_stacks.items())
+    return ''.join(f"{stack} {count}\n" for stack, count in items)
+
+def flame_graph():
+    """
+    Returns:
+        dict: Stack samples as a nested {name, value, children} tree, the
+        format used by d3-flame-graph.
+    """
+    root = {'name': 'all', 'value': 0, 'children': []}
+    with _lock:
+        items = list(_stacks.items())
+    for stack, count in items:
+        root['value'] += count
+        node = root
+        for frame in stack.split(';'):
+            child = next((c for c in node['children'] if c['name'] == frame), None)
+            if child is None:
+                child = {'name': frame, 'value': 0, 'children': []}
+                node['children'].append(child)
+            child['value'] += count
+            node = child
+    return root
+
+def reset():
+    """Discards all collected profiling data."""
+    with _lock:
+        _stacks.clear()
+        _span_totals.clear()
+        _recent.clear()
+
+def _collapse(frame):
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    frames.reverse()
+    return ';'.join(frames)
+
+class _Sampler:
+    """Samples the stacks of threads serving profiled requests."""
+
+    def __init__(self):
+        self._profiles = {}
+        self._lock = threading.Lock()
+        self._active = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiling-sampler', daemon=True)
+        self._thread.start()
+
+    def add(self, profile):
+        with self._lock:
+            self._profiles[profile.thread_id] = profile
+            self._active.set()
+
+    def remove(self, profile):
+        """
+        Stops sampling a profile.
+
+        Returns:
+            Counter: A copy of its samples, safe to read after the sampler moves on.
+        """
+        with self._lock:
+            self._profiles.pop(profile.thread_id, None)
+            if not self._profiles:
+                self._active.clear()
+            return Counter(profile.samples)
+
+    def _run(self):
+        while True:
+            # Sleep until a profiled request is running
+            self._active.wait()
+            time.sleep(_interval.value)
+            frames = sys._current_frames()
+            # Samples are written under the lock remove() copies them under
+            with self._lock:
+                for profile in self._profiles.values():
+                    frame = frames.get(profile.thread_id)
+                    if frame is not None:
+                        profile.samples[_collapse(frame)] += 1
+
+# One sampler thread per process, started on the first profiled request.
+# Threads do not survive fork, so a forked worker starts its own.
+_sampler_instance = None
+_sampler_pid = None
+
+def _sampler():
+    global _sampler_instance, _sampler_pid
+    if _sampler_instance is None or _sampler_pid != os.getpid():
+        with _lock:
+            if _sampler_instance is None or _sampler_pid != os.getpid():
+                _sampler_instance = _Sampler()
+                _sampler_pid = os.getpid()
+    return _sampler_instance
@@ -0,0 +1,320 @@
+"""
+Record and replay of upstream HTTP traffic for the weather client.
+
+A ReplayAdapter is mounted on the weather API session and works in one of
+four modes:
+
+- live: requests go straight to the upstream.
+- record: requests go to the upstream and each response is saved to the archive.
+- replay: responses are served from the archive and the network is never used.
+- fallback: requests go live and successful responses are recorded. The last
+  recorded response is served when the upstream is unreachable or returns 5xx.
+
+The archive is a directory holding one JSON file per distinct request, named
+after the hash of the request key, plus an append-only index.jsonl listing all
+keys. API keys are stripped from request keys and never written to disk.
+Responses served from the archive carry an Age header with the seconds since
+they were recorded.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from datetime import timedelta
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+MODES = ('live', 'record', 'replay', 'fallback')
+
+# Query parameters that are credentials and must not end up in the archive
+SECRET_PARAMS = frozenset(['appid', 'api_key', 'apikey', 'key'])
+
+def request_key(method, url):
+    """
+    Build the archive key for a request: the method and URL with the query
+    parameters sorted and credentials removed.
+    """
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                   if k.lower() not in SECRET_PARAMS)
+    return f"{method.upper()} {parts.scheme}://{parts.netloc}{parts.path}?{urlencode(query)}"
+
+class Archive:
+    """
+    An indexed on-disk archive of upstream responses, one per request key.
+
+    Entries are stored as <sha1 of key>.json and looked up by that name, so
+    several processes can record into the same archive. index.jsonl lists
+    every key for people and tools. A line is appended, in a single write,
+    only the first time a key is stored, so the index is never rewritten.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Directory holding the archive. Created when recording.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        # Entries queued by store_later, readable before they reach disk
+        self._pending = {}
+        self._digests = {}
+        self._idle = threading.Condition(self._lock)
+        self._writer_pid = None
+
+    @staticmethod
+    def filename(key):
+        return hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json'
+
+    def _write_json(self, filename, data):
+        # Write to a temporary file first so readers never see a partial file
+        target = os.path.join(self.path, filename)
+        tmp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp, target)
+
+    def _append_index(self, key, filename):
+        line = json.dumps({'key': key, 'file': filename}) + '\n'
+        # One O_APPEND write, so lines from other processes never interleave
+        fd = os.open(os.path.join(self.path, 'index.jsonl'), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode('utf-8'))
+        finally:
+            os.close(fd)
+
+    def index(self):
+        """
+        Returns:
+            dict: The entry file of every recorded key, as listed in index.jsonl.
+        """
+        index = {}
+        try:
+            with open(os.path.join(self.path, 'index.jsonl'), encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        item = json.loads(line)
+                    except ValueError:
+                        continue
+                    index[item['key']] = {'file': item['file']}
+        except FileNotFoundError:
+            pass
+        return index
+
+    def __len__(self):
+        return len(self.index())
+
+    def __contains__(self, key):
+        return key in self._pending or os.path.exists(os.path.join(self.path, self.filename(key)))
+
+    @staticmethod
+    def _entry(key, status, reason, headers, body, elapsed):
+        return {
+            'key': key,
+            'status': status,
+            'reason': reason,
+            'headers': {'Content-Type': headers.get('Content-Type', 'application/json')},
+            'body': body.decode('utf-8'),
+            'elapsed': elapsed,
+            'recorded_at': time.time()
+        }
+
+    def _save(self, entry):
+        filename = self.filename(entry['key'])
+        with self._write_lock:
+            os.makedirs(self.path, exist_ok=True)
+            is_new = not os.path.exists(os.path.join(self.path, filename))
+            self._write_json(filename, entry)
+            if is_new:
+                self._append_index(entry['key'], filename)
+
+    def store(self, key, status, reason, headers, body, elapsed):
+        """
+        Saves a response, replacing any earlier one recorded for the same key.
+
+        Args:
+            key (str): Key from request_key.
+            status (int): HTTP status code.
+            reason (str): HTTP reason phrase.
+            headers (dict): Response headers.
+            body (bytes): Response body.
+            elapsed (float): Seconds the upstream took to respond.
+        """
+        self._save(self._entry(key, status, reason, headers, body, elapsed))
+
+    def store_later(self, key, status, reason, headers, body, elapsed):
+        """
+        Like store, but the file is written by a background thread so the
+        caller does no disk I/O. A response identical to the last one queued
+        for the key is skipped. load() returns queued entries straight away.
+        """
+        digest = hashlib.sha1(body).hexdigest()
+        with self._lock:
+            if self._digests.get(key) == (status, digest):
+                return
+            self._digests[key] = (status, digest)
+            self._pending[key] = self._entry(key, status, reason, headers, body, elapsed)
+            # Threads do not survive fork, so each process starts its own writer
+            if self._writer_pid != os.getpid():
+                self._writer_pid = os.getpid()
+                threading.Thread(target=self._run_writer, name='archive-writer', daemon=True).start()
+            self._idle.notify_all()
+
+    def flush(self, timeout=None):
+        """
+        Waits until every queued entry has been written.
+
+        Returns:
+            bool: False if entries were still queued after timeout seconds.
+        """
+        with self._lock:
+            return self._idle.wait_for(lambda: not self._pending, timeout)
+
+    def _run_writer(self):
+        while True:
+            with self._lock:
+                self._idle.wait_for(lambda: self._pending)
+                key, entry = next(iter(self._pending.items()))
+            try:
+                self._save(entry)
+            except OSError as e:
+                logger.error(f"Could not record upstream response for {key}: {str(e)}")
+            with self._lock:
+                # Keep the entry queued if a newer response replaced it meanwhile
+                if self._pending.get(key) is entry:
+                    del self._pending[key]
+                self._idle.notify_all()
+
+    def load(self, key):
+        """
+        Returns:
+            dict: The recorded entry for key, or None if nothing was recorded.
+        """
+        with self._lock:
+            entry = self._pending.get(key)
+        if entry is not None:
+            return entry
+        try:
+            with open(os.path.join(self.path, self.filename(key)), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+class ReplayAdapter(HTTPAdapter):
+    """A transport adapter that records, replays or falls back to archived responses."""
+
+    def __init__(self, archive, mode='replay', replay_latency=False, **kwargs):
+        """
+        Args:
+            archive (Archive): Where responses are recorded and replayed from.
+            mode (str): One of MODES.
+            replay_latency (bool): Sleep for the recorded upstream latency when replaying.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown upstream mode '{mode}', expected one of {', '.join(MODES)}")
+        super().__init__(**kwargs)
+        self.archive = archive
+        self.mode = mode
+        self.replay_latency = replay_latency
+
+    def send(self, request, **kwargs):
+        key = request_key(request.method, request.url)
+
+        if self.mode == 'replay':
+            response = self._replay(request, key)
+            if response is None:
+                raise requests.exceptions.ConnectionError(f"No recorded response for {key}", request=request)
+            return response
+
+        start = time.perf_counter()
+        try:
+            response = super().send(request, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if self.mode != 'fallback':
+                raise
+            recorded = self._replay(request, key)
+            if recorded is None:
+                raise
+            logger.warning(f"Upstream unreachable, serving recorded response for {key}: {str(e)}")
+            return recorded
+
+        if self.mode == 'fallback' and response.status_code >= 500:
+            # A failing upstream counts as unreachable
+            recorded = self._replay(request, key)
+            if recorded is not None:
+                logger.warning(f"Upstream returned {response.status_code}, serving recorded response for {key}")
+                response.close()
+                return recorded
+
+        # Record mode keeps every response for faithful replays. Fallback mode
+        # only keeps successes, so an error never replaces a good response, and
+        # leaves the disk writes to the archive's background thread.
+        if self.mode == 'record' or (self.mode == 'fallback' and 200 <= response.status_code < 300):
+            # Reading content here includes the body transfer in the latency.
+            # Session.send only sets response.elapsed after the adapter returns.
+            content = response.content
+            store = self.archive.store if self.mode == 'record' else self.archive.store_later
+            store(key, response.status_code, response.reason, response.headers,
+                  content, time.perf_counter() - start)
+        return response
+
+    def _replay(self, request, key):
+        entry = self.archive.load(key)
+        if entry is None:
+            return None
+        if self.replay_latency:
+            time.sleep(entry['elapsed'])
+
+        response = requests.Response()
+        response.status_code = entry['status']
+        response.reason = entry['reason']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        # Lets clients tell recorded data from fresh data
+        response.headers['Age'] = str(int(max(0, time.time() - entry['recorded_at'])))
+        response._content = entry['body'].encode('utf-8')
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        response.elapsed = timedelta(seconds=entry['elapsed'])
+        response.connection = self
+        return response
+
+def configure_session(session, mode=None, archive_path=None, replay_latency=None, pool_maxsize=None):
+    """
+    Mounts a ReplayAdapter on a session according to the arguments, falling
+    back to the WEATHER_UPSTREAM_MODE, WEATHER_ARCHIVE_DIR and
+    WEATHER_REPLAY_LATENCY environment variables.
+
+    Args:
+        session (requests.Session): The session to configure.
+        mode (str): One of MODES. 'live' leaves the session untouched.
+        archive_path (str): Directory of the archive.
+        replay_latency (bool): Sleep for recorded latencies when replaying.
+        pool_maxsize (int): Connections kept per host, the HTTPAdapter default when None.
+
+    Returns:
+        requests.Session: The same session.
+    """
+    mode = mode or os.environ.get("WEATHER_UPSTREAM_MODE", "live")
+    if mode == 'live':
+        return session
+    archive_path = archive_path or os.environ.get("WEATHER_ARCHIVE_DIR", "upstream_archive")
+    if replay_latency is None:
+        replay_latency = os.environ.get("WEATHER_REPLAY_LATENCY", "0") == "1"
+
+    pool_kwargs = {} if pool_maxsize is None else {'pool_maxsize': pool_maxsize}
+    adapter = ReplayAdapter(Archive(archive_path), mode=mode, replay_latency=replay_latency, **pool_kwargs)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    logger.info(f"Weather upstream in {mode} mode using archive {archive_path} ({len(adapter.archive)} entries)")
+    return session
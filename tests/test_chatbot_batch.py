@@ -0,0 +1,61 @@
+import time
+
+import pytest
+
+import app as app_module
+import chatbot
+from weather_api import Observation
+
+
+@pytest.fixture
+def fetches(monkeypatch):
+    """Replace the upstream fetch with a stub that records requested cities."""
+    calls = []
+
+    def fake_fetch(city, api_key):
+        calls.append(city)
+        if city.lower() == 'atlantis':
+            raise Exception("Failed to fetch weather data: 404 Client Error")
+        return Observation(city.title(), 'XX', 12, 11, 60, 1012, 3, 'clear sky', '01d', time.time(), 0, 0)
+
+    monkeypatch.setattr(chatbot, 'fetch_observation', fake_fetch)
+    return calls
+
+
+def test_batch_fetches_each_city_once_in_input_order(fetches):
+    responses = chatbot.get_chatbot_responses([
+        "What's the weather in London?",
+        "Is it safe to drive in Atlantis?",
+        "hello",
+        "What's the weather in Paris?",
+        "what's the weather in london?",
+        "Is it safe to drive in Paris?"
+    ])
+
+    assert sorted(city.lower() for city in fetches) == ['atlantis', 'london', 'paris']
+    assert len(responses) == 6
+    assert 'Weather in London' in responses[0]
+    assert "couldn't retrieve the weather information for Atlantis" in responses[1]
+    assert 'Weather in Paris' in responses[3]
+    assert 'Weather in London' in responses[4]
+    assert 'TRAVEL SAFETY ASSESSMENT FOR PARIS' in responses[5]
+
+
+def test_batch_endpoint_rejects_bad_and_oversized_batches(fetches, monkeypatch):
+    client = app_module.app.test_client()
+
+    assert client.post('/api/chatbot/batch', json={'messages': 'hello'}).status_code == 400
+    assert client.post('/api/chatbot/batch', json={'messages': [1, 2]}).status_code == 400
+
+    monkeypatch.setattr(app_module, 'CHATBOT_BATCH_MAX_MESSAGES', 2)
+    assert client.post('/api/chatbot/batch', json={'messages': ['hi'] * 3}).status_code == 413
+
+    monkeypatch.setattr(chatbot, 'BATCH_MAX_CITIES', 1)
+    messages = ["What's the weather in London?", "What's the weather in Paris?"]
+    response = client.post('/api/chatbot/batch', json={'messages': messages})
+    assert response.status_code == 413
+    assert fetches == []
+
+    response = client.post('/api/chatbot/batch', json={'messages': messages[:1]})
+    assert response.status_code == 200
+    assert 'Weather in London' in response.get_json()['responses'][0]
@@ -0,0 +1,64 @@
+import time
+
+import pytest
+
+import chatbot
+from weather_api import Observation
+
+
+@pytest.fixture
+def fetches(monkeypatch):
+    """Replace the upstream fetch with a stub that records requested cities."""
+    calls = []
+
+    def fake_fetch(city, api_key):
+        calls.append(city)
+        return Observation(city.title(), 'XX', 12, 11, 60, 1012, 3, 'clear sky', '01d', time.time(), 0, 0)
+
+    monkeypatch.setattr(chatbot, 'fetch_observation', fake_fetch)
+    monkeypatch.setattr(chatbot, 'conversation_store', chatbot.ConversationStore())
+    return calls
+
+
+def test_follow_up_reuses_city_and_snapshot(fetches):
+    session = {'conversation_id': 'abc'}
+    chatbot.get_chatbot_response("What's the weather in London?", session=session)
+    response = chatbot.get_chatbot_response("Is it safe to drive there?", session=session)
+
+    assert 'TRAVEL SAFETY ASSESSMENT FOR LONDON' in response
+    assert fetches == ['London']
+    assert session['city'] == 'London'
+
+
+def test_new_city_wins_over_remembered_city(fetches):
+    session = {'conversation_id': 'abc'}
+    chatbot.get_chatbot_response("What's the weather in London?", session=session)
+
+    assert 'Weather in Paris' in chatbot.get_chatbot_response("What's the weather in Paris tomorrow?", session=session)
+    assert 'FOR TOKYO' in chatbot.get_chatbot_response("I'm flying to Tokyo, is it safe to drive there?", session=session)
+    assert fetches == ['London', 'Paris', 'Tokyo']
+    assert session['city'] == 'Tokyo'
+
+
+def test_follow_up_works_on_another_worker(fetches):
+    # Only the signed session travels between workers, not the snapshot cache
+    session = {'conversation_id': 'abc', 'city': 'London'}
+    response = chatbot.get_chatbot_response("Is it safe to drive there?", session=session)
+
+    assert 'FOR LONDON' in response
+    assert fetches == ['London']
+
+
+def test_follow_up_without_session_asks_for_city(fetches):
+    response = chatbot.get_chatbot_response("Is it safe to drive there?")
+
+    assert 'I need to know your location' in response
+    assert fetches == []
+
+
+def test_replayed_snapshot_is_not_fresh():
+    store = chatbot.ConversationStore()
+    old = Observation('London', 'GB', 12, 11, 60, 1012, 3, 'clear sky', '01d', time.time() - 3600, 0, 0)
+    store.remember('abc', 'London', old, {})
+
+    assert not store.is_fresh(store.get('abc'), 600)
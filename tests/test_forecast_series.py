@@ -0,0 +1,24 @@
+import json
+
+from weather_api import ForecastSeries
+
+
+def forecast_json(temperatures):
+    return {
+        'city': {'name': 'London', 'country': 'GB'},
+        'list': [{
+            'dt': 1700000000 + i * 3 * 3600,
+            'main': {'temp': temp, 'feels_like': temp, 'humidity': 70},
+            'weather': [{'description': 'light rain', 'icon': '10d'}]
+        } for i, temp in enumerate(temperatures)]
+    }
+
+
+def test_temperatures_keep_their_upstream_type():
+    data = forecast_json([20] * 8 + [12.5] * 8)
+    forecast = ForecastSeries.from_json(data, days=2).to_dict()['forecast']
+
+    assert [day['temperature'] for day in forecast] == [20, 12.5]
+    assert json.dumps([day['feels_like'] for day in forecast]) == '[20, 12.5]'
+    assert forecast[0]['humidity'] == 70
+    assert len(forecast) == 2
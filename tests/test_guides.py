@@ -0,0 +1,35 @@
+import pytest
+
+from app import app
+from guides import StaticDocument, brotli
+
+
+@pytest.fixture
+def document():
+    return StaticDocument({'hazard': 'heat', 'guides': ['Drink water']})
+
+
+@pytest.mark.parametrize('accept_encoding, expected', [
+    ('gzip', 'gzip'),
+    ('br;q=0, *', 'gzip'),
+    ('br;q=0, gzip;q=0, *', 'identity'),
+    ('gzip;q=0', 'identity'),
+    (None, 'identity')
+])
+def test_negotiate_skips_refused_codings(document, accept_encoding, expected):
+    assert document.negotiate(accept_encoding)[0] == expected
+
+
+@pytest.mark.skipif(brotli is None, reason="brotli is not installed")
+def test_negotiate_prefers_brotli(document):
+    assert document.negotiate('gzip, br')[0] == 'br'
+
+
+@pytest.mark.parametrize('if_none_match', ['*', '"other", {etag}', 'W/{etag}'])
+def test_guide_revalidation(if_none_match):
+    client = app.test_client()
+    etag = client.get('/api/guides').headers['ETag']
+
+    response = client.get('/api/guides', headers={'If-None-Match': if_none_match.format(etag=etag)})
+    assert response.status_code == 304
+    assert client.get('/api/guides', headers={'If-None-Match': '"other"'}).status_code == 200
@@ -0,0 +1,92 @@
+import time
+
+import pytest
+import requests
+
+from weather_api import HedgedFetcher
+
+
+class FakeProvider:
+    def __init__(self, name, error=None, delay=0):
+        self.name = name
+        self.error = error
+        self.delay = delay
+        self.calls = 0
+
+    def fetch_current(self, location):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return f"{self.name}:{location}"
+
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.exceptions.HTTPError(f"{status} error", response=response)
+
+
+@pytest.mark.parametrize('error', [
+    requests.exceptions.ConnectionError("refused"),
+    requests.exceptions.Timeout("timed out"),
+    http_error(503)
+])
+def test_upstream_failures_fall_back_to_secondary(error):
+    secondary = FakeProvider('secondary')
+    fetcher = HedgedFetcher([FakeProvider('primary', error), secondary], hedge_budget=0)
+
+    assert fetcher.fetch('London') == 'secondary:London'
+    assert fetcher.stats()['fallback_wins'] == 1
+
+
+def test_client_errors_are_raised_without_fallback():
+    secondary = FakeProvider('secondary')
+    fetcher = HedgedFetcher([FakeProvider('primary', http_error(404)), secondary], hedge_budget=0)
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        fetcher.fetch('Atlantis')
+    assert secondary.calls == 0
+    assert fetcher.stats()['fallbacks'] == 0
+
+
+def test_hedge_sent_after_percentile_delay_and_wins():
+    primary, secondary = FakeProvider('primary', delay=0.01), FakeProvider('secondary')
+    fetcher = HedgedFetcher([primary, secondary], hedge_budget=1, min_samples=5, initial_hedge_delay=5)
+    for _ in range(5):
+        assert fetcher.fetch('London') == 'primary:London'
+    assert secondary.calls == 0
+    assert fetcher.hedge_delay() < 0.1
+
+    primary.delay = 0.5
+    start = time.perf_counter()
+    assert fetcher.fetch('London') == 'secondary:London'
+    assert time.perf_counter() - start < 0.3
+
+    stats = fetcher.stats()
+    assert stats['hedges_sent'] == 1
+    assert stats['hedge_wins'] == 1
+    assert stats['hedge_win_rate'] == 1.0
+
+
+def test_hedges_stop_at_budget():
+    secondary = FakeProvider('secondary')
+    fetcher = HedgedFetcher([FakeProvider('primary', delay=0.05), secondary],
+                            hedge_budget=0.5, initial_hedge_delay=0.01)
+    for _ in range(4):
+        fetcher.fetch('London')
+
+    stats = fetcher.stats()
+    assert stats['hedges_sent'] == secondary.calls == 2
+    assert stats['hedges_over_budget'] == 2
+
+
+def test_failed_hedge_does_not_fail_request():
+    primary = FakeProvider('primary', delay=0.3)
+    secondary = FakeProvider('secondary', error=http_error(429), delay=0.05)
+    fetcher = HedgedFetcher([primary, secondary], hedge_budget=1, initial_hedge_delay=0.05)
+
+    assert fetcher.fetch('London') == 'primary:London'
+    stats = fetcher.stats()
+    assert stats['hedge_errors'] == 1
+    assert stats['errors'] == 0
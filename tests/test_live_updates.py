@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+import live_updates
+from live_updates import LiveWeatherHub, LiveCapacityError, LocationFeed
+
+
+@pytest.fixture(autouse=True)
+def no_threads(monkeypatch):
+    """Keep feeds from starting refresh loops, tests drive them by hand."""
+    monkeypatch.setattr(LocationFeed, 'start', lambda self: None)
+
+
+def drain(subscription):
+    events = []
+    while not subscription._events.empty():
+        head, data = subscription._events.get_nowait().split('\n', 1)
+        events.append((head[len('event: '):], json.loads(data[len('data: '):])))
+    return events
+
+
+def test_overflow_resyncs_every_location():
+    hub = LiveWeatherHub('key', max_pending=3)
+    subscription = hub.subscribe(['London', 'Paris'])
+    london, paris = hub._feeds['london'], hub._feeds['paris']
+    paris.snapshot, paris.version = {'temperature': 20}, 1
+
+    for temperature in range(5):
+        london.snapshot, london.version = {'temperature': temperature}, temperature + 1
+        subscription.push(f"event: delta\ndata: {json.dumps({'location': 'london'})}\n\n")
+
+    events = drain(subscription)
+    assert sorted(data['location'] for kind, data in events if kind == 'snapshot') == ['london', 'paris']
+    assert len(events) <= 3
+
+
+def test_feed_limit_rejects_new_locations():
+    hub = LiveWeatherHub('key', max_feeds=2)
+    hub.subscribe(['London', 'Paris'])
+    hub.subscribe(['london'])
+
+    with pytest.raises(LiveCapacityError):
+        hub.subscribe(['Tokyo'])
+    assert sorted(hub.stats()) == ['london', 'paris']
+
+
+def test_stream_limit_frees_slot_on_unsubscribe():
+    hub = LiveWeatherHub('key', max_subscriptions=1)
+    subscription = hub.subscribe(['London'])
+    with pytest.raises(LiveCapacityError):
+        hub.subscribe(['London'])
+
+    hub.unsubscribe(subscription)
+    hub.subscribe(['London'])
+
+
+def test_failing_location_sends_error_and_is_dropped(monkeypatch):
+    hub = LiveWeatherHub('key', interval=0.01, max_failures=2)
+
+    def fail(location, api_key):
+        raise ValueError(f"City not found: {location}")
+
+    monkeypatch.setattr(live_updates, 'fetch_observation', fail)
+    subscription = hub.subscribe(['Atlantis'])
+    hub._feeds['atlantis']._run()
+
+    assert drain(subscription) == [
+        ('error', {'location': 'atlantis', 'error': 'City not found: atlantis', 'retrying': True}),
+        ('error', {'location': 'atlantis', 'error': 'City not found: atlantis', 'retrying': False})
+    ]
+    assert hub.stats() == {}
@@ -0,0 +1,66 @@
+import os
+import multiprocessing
+import time
+
+import pytest
+
+import profiling
+
+
+@pytest.fixture(autouse=True)
+def fast_sampling():
+    previous = profiling.configure()
+    profiling.configure(interval=0.001)
+    profiling.reset()
+    yield
+    profiling.configure(interval=previous['interval'])
+    profiling.reset()
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_finish_merges_the_samples_it_reports():
+    token = profiling.start('GET /test')
+    with profiling.span('work'):
+        busy(0.05)
+    summary = profiling.finish(token)
+
+    # Samples taken after finish must not reach the report
+    busy(0.02)
+    stacks = profiling.collapsed_stacks().splitlines()
+    assert summary['samples'] > 0
+    assert sum(int(line.rsplit(' ', 1)[1]) for line in stacks) == summary['samples']
+    assert any('test_profiling.py:busy' in line for line in stacks)
+    assert [span['name'] for span in summary['spans']] == ['work']
+
+
+def test_settings_changed_in_one_worker_apply_to_all():
+    ctx = multiprocessing.get_context('fork')
+    worker = ctx.Process(target=profiling.configure, kwargs={'sample_rate': 0.25})
+    worker.start()
+    worker.join()
+
+    assert profiling.settings()['sample_rate'] == 0.25
+    profiling.configure(sample_rate=0)
+
+
+def test_server_timing_only_for_admin_requests(monkeypatch):
+    from app import app
+
+    monkeypatch.setenv('ADMIN_TOKEN', 'secret')
+    client = app.test_client()
+    profiling.configure(sample_rate=1)
+    try:
+        sampled = client.get('/api/guides')
+        requested = client.get('/api/guides', headers={'X-Profile': 'secret'})
+    finally:
+        profiling.configure(sample_rate=0)
+
+    assert 'Server-Timing' not in sampled.headers
+    assert 'total;dur=' in requested.headers['Server-Timing']
+    assert profiling.span_report()['recent'][0]['request'] == 'GET /api/guides'
+    assert client.get('/admin/profile', headers={'X-Admin-Token': 'secret'}).get_json()['pid'] == os.getpid()
@@ -0,0 +1,99 @@
+import io
+import time
+
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+
+from replay import Archive, ReplayAdapter, request_key
+
+URL = 'https://api.openweathermap.org/data/2.5/weather?q=London&appid=secret&units=metric'
+
+
+def make_response(status, body):
+    response = requests.Response()
+    response.status_code = status
+    response.reason = 'OK' if status < 400 else 'Error'
+    response._content = body
+    response.raw = io.BytesIO(body)
+    response.headers['Content-Type'] = 'application/json'
+    return response
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Stub the real transport. Set upstream['response'] to a Response or an exception."""
+    state = {}
+
+    def fake_send(self, request, **kwargs):
+        if isinstance(state['response'], Exception):
+            raise state['response']
+        return state['response']
+
+    monkeypatch.setattr(HTTPAdapter, 'send', fake_send)
+    return state
+
+
+def session_for(archive, mode):
+    session = requests.Session()
+    session.mount('https://', ReplayAdapter(archive, mode=mode))
+    return session
+
+
+def test_request_key_strips_api_key():
+    assert 'secret' not in request_key('GET', URL)
+
+
+def test_archives_in_separate_processes_keep_each_others_entries(tmp_path):
+    first, second = Archive(str(tmp_path)), Archive(str(tmp_path))
+    first.store('k1', 200, 'OK', {}, b'{}', 0.1)
+    second.store('k2', 200, 'OK', {}, b'{}', 0.1)
+
+    assert set(Archive(str(tmp_path)).index()) == {'k1', 'k2'}
+    assert first.load('k2') is not None
+
+
+def test_replay_serves_recorded_response(tmp_path, upstream):
+    upstream['response'] = make_response(200, b'{"name": "London"}')
+    session_for(Archive(str(tmp_path)), 'record').get(URL)
+
+    upstream['response'] = requests.exceptions.ConnectionError('offline')
+    assert session_for(Archive(str(tmp_path)), 'replay').get(URL).json() == {'name': 'London'}
+
+
+def test_fallback_keeps_last_good_response_over_errors(tmp_path, upstream):
+    session = session_for(Archive(str(tmp_path)), 'fallback')
+    upstream['response'] = make_response(200, b'{"ok": true}')
+    session.get(URL)
+
+    upstream['response'] = make_response(503, b'{"ok": false}')
+    assert session.get(URL).json() == {'ok': True}
+
+    upstream['response'] = make_response(429, b'{"ok": false}')
+    assert session.get(URL).status_code == 429
+
+    upstream['response'] = requests.exceptions.ConnectionError('offline')
+    assert session.get(URL).json() == {'ok': True}
+
+
+def test_fallback_records_in_background_and_skips_unchanged_bodies(tmp_path, upstream):
+    archive = Archive(str(tmp_path))
+    session = session_for(archive, 'fallback')
+    upstream['response'] = make_response(200, b'{"ok": true}')
+    for _ in range(3):
+        session.get(URL)
+    upstream['response'] = make_response(200, b'{"ok": "newer"}')
+    session.get(URL)
+
+    assert archive.flush(timeout=5)
+    assert (tmp_path / 'index.jsonl').read_text().count('\n') == 1
+    assert Archive(str(tmp_path)).load(request_key('GET', URL))['body'] == '{"ok": "newer"}'
+
+
+def test_replayed_responses_carry_their_age(tmp_path, upstream, monkeypatch):
+    archive = Archive(str(tmp_path))
+    upstream['response'] = make_response(200, b'{"name": "London"}')
+    session_for(archive, 'record').get(URL)
+
+    monkeypatch.setattr(time, 'time', lambda now=time.time(): now + 3600)
+    assert int(session_for(archive, 'replay').get(URL).headers['Age']) >= 3599
@@ -0,0 +1,32 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def imported_after(code, **env):
+    """Run code in a fresh interpreter and return which modules it loaded."""
+    script = f"import sys\n{code}\nimport json\nprint(json.dumps(sorted(sys.modules)))"
+    result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True,
+                            env={**os.environ, 'WEATHER_UPSTREAM_MODE': 'live', **env}, check=True)
+    return set(json.loads(result.stdout.splitlines()[-1]))
+
+
+def test_optional_subsystems_load_on_first_use():
+    modules = imported_after("import app\nfrom weather_api import get_session\nget_session()")
+    assert 'chatbot_responses' in modules
+    assert not {'live_updates', 'guides', 'replay'} & modules
+
+    modules = imported_after("import app\napp.preload()\napp.get_live_hub()")
+    assert {'guides', 'live_updates'} <= modules
+
+
+def test_session_pool_fits_worker_threads():
+    modules = imported_after(
+        "from weather_api import get_session\n"
+        "assert get_session().get_adapter('https://api.openweathermap.org')._pool_maxsize == 64",
+        GUNICORN_THREADS='32'
+    )
+    assert 'replay' not in modules
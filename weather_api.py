@@ -1,11 +1,536 @@
+import os
+import time
 import requests
 import logging
+import threading
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
+from functools import lru_cache
+from requests.adapters import HTTPAdapter
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+OPENWEATHER_BASE_URL = "https://api.openweathermap.org"
+
+# Request threads per worker process, as configured in gunicorn_config.py.
+# Upstream pools are sized from it so they never queue request threads.
+WORKER_THREADS = int(os.environ.get("GUNICORN_THREADS", "64"))
+# Connections kept per upstream host. Request threads and hedges can all be
+# calling out at once, and a connection that does not fit is closed on return.
+POOL_MAXSIZE = 2 * WORKER_THREADS
+
+# One pooled session per process. Gunicorn forks workers from a preloaded
+# master, so the session is rebuilt whenever the pid changes rather than
+# sharing sockets across processes.
+_session = None
+_session_pid = None
+
+def get_session():
+    """
+    Returns the HTTP session used for all OpenWeatherMap calls in this process.
+    
+    Returns:
+        requests.Session: A session with keep-alive connection pooling.
+    """
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=POOL_MAXSIZE)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if os.environ.get("WEATHER_UPSTREAM_MODE", "live") != "live":
+            # Only load the record/replay transport when it is asked for
+            from replay import configure_session
+            configure_session(session, pool_maxsize=POOL_MAXSIZE)
+        _session = session
+        _session_pid = os.getpid()
+    return _session
+
+def warmup(timeout=2):
+    """
+    Opens a pooled connection to OpenWeatherMap so the first real request
+    skips DNS lookup and the TLS handshake.
+    
+    Args:
+        timeout (float): Seconds to wait before giving up on the upstream.
+        
+    Returns:
+        bool: True if the connection was established.
+    """
+    if os.environ.get("WEATHER_UPSTREAM_MODE") == "replay":
+        # Replayed responses come from disk, there is no connection to open
+        return True
+    try:
+        get_session().head(OPENWEATHER_BASE_URL, timeout=timeout)
+        return True
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Weather API warmup failed: {str(e)}")
+        return False
+
+def _response_age(response):
+    """
+    Seconds since a response was produced upstream, from its Age header. Set
+    on responses replayed from the archive, so old data keeps its old timestamp.
+    """
+    try:
+        return max(0.0, float(response.headers.get('Age') or 0))
+    except ValueError:
+        return 0.0
+
+@lru_cache(maxsize=4096)
+def _format_timestamp(timestamp, fmt):
+    """Format a unix timestamp in local time, caching repeated conversions."""
+    return datetime.fromtimestamp(timestamp).strftime(fmt)
+
+class Observation:
+    """
+    A single current-weather observation, parsed once from the upstream JSON.
+    
+    Uses __slots__ to keep per-instance memory small when many observations
+    are cached. Timestamps are kept as numbers and only formatted on first
+    access. Supports read-only mapping access (obs['temperature']) so code
+    written against the dict returned by get_weather_data keeps working.
+    """
+    
+    FIELDS = ('location', 'country', 'temperature', 'feels_like', 'humidity', 'pressure',
+              'wind_speed', 'description', 'icon', 'timestamp', 'sunrise', 'sunset')
+    
+    __slots__ = ('location', 'country', 'temperature', 'feels_like', 'humidity', 'pressure',
+                 'wind_speed', 'description', 'icon', 'observed_at', 'sunrise_ts', 'sunset_ts',
+                 '_timestamp', '_sunrise', '_sunset')
+    
+    def __init__(self, location, country, temperature, feels_like, humidity, pressure,
+                 wind_speed, description, icon, observed_at, sunrise_ts, sunset_ts):
+        self.location = location
+        self.country = country
+        self.temperature = temperature
+        self.feels_like = feels_like
+        self.humidity = humidity
+        self.pressure = pressure
+        self.wind_speed = wind_speed
+        self.description = description
+        self.icon = icon
+        self.observed_at = observed_at
+        self.sunrise_ts = sunrise_ts
+        self.sunset_ts = sunset_ts
+        self._timestamp = None
+        self._sunrise = None
+        self._sunset = None
+    
+    @classmethod
+    def from_json(cls, data, observed_at=None):
+        """
+        Build an observation from an OpenWeatherMap /weather response.
+        
+        Args:
+            data (dict): Decoded upstream JSON.
+            observed_at (float): Unix time of the fetch, defaults to now.
+            
+        Returns:
+            Observation: The parsed observation.
+        """
+        main = data['main']
+        sys_data = data['sys']
+        weather = data['weather'][0]
+        return cls(
+            data['name'], sys_data['country'], main['temp'], main['feels_like'],
+            main['humidity'], main['pressure'], data['wind']['speed'],
+            weather['description'], weather['icon'],
+            time.time() if observed_at is None else observed_at,
+            sys_data['sunrise'], sys_data['sunset']
+        )
+    
+    @property
+    def timestamp(self):
+        if self._timestamp is None:
+            self._timestamp = datetime.fromtimestamp(self.observed_at).isoformat()
+        return self._timestamp
+    
+    @property
+    def sunrise(self):
+        if self._sunrise is None:
+            self._sunrise = _format_timestamp(self.sunrise_ts, '%H:%M')
+        return self._sunrise
+    
+    @property
+    def sunset(self):
+        if self._sunset is None:
+            self._sunset = _format_timestamp(self.sunset_ts, '%H:%M')
+        return self._sunset
+    
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+    
+    def __contains__(self, key):
+        return key in self.FIELDS
+    
+    def get(self, key, default=None):
+        return self[key] if key in self.FIELDS else default
+    
+    def to_dict(self):
+        """
+        Returns:
+            dict: The observation in the shape returned by get_weather_data.
+        """
+        return {field: getattr(self, field) for field in self.FIELDS}
+    
+    def __repr__(self):
+        return f"Observation({self.location!r}, {self.temperature!r}, {self.description!r})"
+
+class ForecastSeries:
+    """
+    A forecast for one location, stored column-wise.
+    
+    Times and humidity are integers and are kept in compact arrays.
+    Temperatures stay in lists, so the upstream numbers come back exactly as
+    sent (an int 20 is not turned into 20.0).
+    
+    Only the entries that are kept (one per day) are parsed. Dates and day
+    names are formatted when the series is serialized.
+    """
+    
+    __slots__ = ('location', 'country', 'times', 'temperatures', 'feels_like',
+                 'humidity', 'descriptions', 'icons')
+    
+    def __init__(self, location, country):
+        self.location = location
+        self.country = country
+        self.times = array('q')
+        self.temperatures = []
+        self.feels_like = []
+        self.humidity = array('h')
+        self.descriptions = []
+        self.icons = []
+    
+    @classmethod
+    def from_json(cls, data, days=5):
+        """
+        Build a series from an OpenWeatherMap /forecast response.
+        
+        Args:
+            data (dict): Decoded upstream JSON.
+            days (int): Number of days to keep.
+            
+        Returns:
+            ForecastSeries: The parsed forecast.
+        """
+        series = cls(data['city']['name'], data['city']['country'])
+        # Every 8th entry (3-hour steps) is approximately a day
+        for forecast in data['list'][:days * 8:8]:
+            series.append(forecast['dt'], forecast['main']['temp'], forecast['main']['feels_like'],
+                          forecast['main']['humidity'], forecast['weather'][0]['description'],
+                          forecast['weather'][0]['icon'])
+        return series
+    
+    def append(self, dt, temperature, feels_like, humidity, description, icon):
+        self.times.append(dt)
+        self.temperatures.append(temperature)
+        self.feels_like.append(feels_like)
+        self.humidity.append(humidity)
+        self.descriptions.append(description)
+        self.icons.append(icon)
+    
+    def __len__(self):
+        return len(self.times)
+    
+    def entry(self, index):
+        """
+        Returns:
+            dict: One forecast day in the shape used by get_forecast.
+        """
+        dt = self.times[index]
+        return {
+            'date': _format_timestamp(dt, '%Y-%m-%d'),
+            'day': _format_timestamp(dt, '%A'),
+            'temperature': self.temperatures[index],
+            'feels_like': self.feels_like[index],
+            'humidity': self.humidity[index],
+            'description': self.descriptions[index],
+            'icon': self.icons[index]
+        }
+    
+    def to_dict(self):
+        """
+        Returns:
+            dict: The forecast in the shape returned by get_forecast.
+        """
+        return {
+            'location': self.location,
+            'country': self.country,
+            'forecast': [self.entry(i) for i in range(len(self))]
+        }
+
+class OpenWeatherMapProvider:
+    """
+    Current weather from an OpenWeatherMap-compatible API.
+    
+    The default instance talks to OpenWeatherMap itself. A second instance
+    pointed at another base URL (a mirror, proxy or a compatible service) can
+    act as the secondary provider for HedgedFetcher.
+    """
+    
+    def __init__(self, api_key, base_url=None, name='openweathermap', timeout=10):
+        """
+        Args:
+            api_key (str): API key sent as the appid parameter.
+            base_url (str): API root, defaults to OPENWEATHER_BASE_URL.
+            name (str): Name used in logs and metrics.
+            timeout (float): Seconds to wait for the upstream.
+        """
+        self.api_key = api_key
+        self.base_url = base_url
+        self.name = name
+        self.timeout = timeout
+    
+    def fetch_current(self, location):
+        """
+        Returns:
+            Observation: The current weather for location.
+        """
+        url = f"{self.base_url or OPENWEATHER_BASE_URL}/data/2.5/weather"
+        params = {
+            'q': location,
+            'appid': self.api_key,
+            'units': 'metric'  # Use metric units (Celsius)
+        }
+        response = get_session().get(url, params=params, timeout=self.timeout)
+        response.raise_for_status()  # Raises an exception for HTTP errors
+        return Observation.from_json(response.json(), observed_at=time.time() - _response_age(response))
+
+class HedgedFetcher:
+    """
+    Fetches current weather from a primary provider, hedging slow requests.
+    
+    If the primary request is still outstanding after the given percentile of
+    recent primary latencies, a duplicate is sent to the secondary provider
+    (or to the primary again when there is only one) and the first success
+    wins. A failed hedge is only counted, the primary is still awaited. If the
+    primary fails with a connection error, a timeout or a 5xx, the secondary
+    is tried as a fallback. A 4xx from the primary, such as an unknown city,
+    is the client's problem and is raised at once. Hedges are capped at
+    hedge_budget times the number of requests so quota use stays bounded.
+    While the budget has no room for a hedge, the upstream is called on the
+    request thread without going through the executor.
+    """
+    
+    def __init__(self, providers, hedge_budget=0.05, hedge_percentile=95, min_samples=20,
+                 initial_hedge_delay=1.0, window=200, max_workers=16):
+        """
+        Args:
+            providers (list): Primary provider first, then an optional secondary.
+            hedge_budget (float): Maximum fraction of requests that may be hedged.
+            hedge_percentile (float): Latency percentile after which to hedge.
+            min_samples (int): Latency samples needed before the percentile is used.
+            initial_hedge_delay (float): Hedge delay in seconds until then.
+            window (int): Number of recent latencies kept.
+            max_workers (int): Threads available for upstream requests.
+        """
+        if not providers:
+            raise ValueError("At least one weather provider is required")
+        self.providers = list(providers)
+        self.hedge_budget = hedge_budget
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.initial_hedge_delay = initial_hedge_delay
+        self._latencies = deque(maxlen=window)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='weather-upstream')
+        self._lock = threading.Lock()
+        self._metrics = {
+            'requests': 0,
+            'hedges_sent': 0,
+            'hedge_wins': 0,
+            'hedge_errors': 0,
+            'hedges_over_budget': 0,
+            'fallbacks': 0,
+            'fallback_wins': 0,
+            'errors': 0
+        }
+    
+    def hedge_delay(self):
+        """
+        Returns:
+            float: Seconds to wait on the primary before sending a hedge.
+        """
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < self.min_samples:
+            return self.initial_hedge_delay
+        index = min(len(samples) - 1, int(len(samples) * self.hedge_percentile / 100))
+        return samples[index]
+    
+    def stats(self):
+        """
+        Returns:
+            dict: Request, hedge and fallback counters plus the current hedge delay.
+        """
+        with self._lock:
+            stats = dict(self._metrics)
+        stats['hedge_win_rate'] = stats['hedge_wins'] / stats['hedges_sent'] if stats['hedges_sent'] else 0.0
+        stats['hedge_delay'] = self.hedge_delay()
+        return stats
+    
+    def _count(self, metric):
+        with self._lock:
+            self._metrics[metric] += 1
+    
+    def _timed(self, provider, location):
+        start = time.perf_counter()
+        result = provider.fetch_current(location)
+        return result, time.perf_counter() - start
+    
+    def _record_latency(self, future):
+        if future.exception() is None:
+            with self._lock:
+                self._latencies.append(future.result()[1])
+    
+    @staticmethod
+    def _is_retryable(error):
+        # Only upstream trouble is worth another provider, not a bad request
+        if isinstance(error, requests.exceptions.HTTPError):
+            return error.response is None or error.response.status_code >= 500
+        return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+    
+    def _can_hedge(self):
+        with self._lock:
+            return self._metrics['hedges_sent'] + 1 <= self.hedge_budget * self._metrics['requests']
+    
+    def _take_hedge(self):
+        with self._lock:
+            if self._metrics['hedges_sent'] + 1 > self.hedge_budget * self._metrics['requests']:
+                self._metrics['hedges_over_budget'] += 1
+                return False
+            self._metrics['hedges_sent'] += 1
+            return True
+    
+    def fetch(self, location):
+        """
+        Fetches current weather for a location.
+        
+        Args:
+            location (str): The city name or coordinates.
+            
+        Returns:
+            Observation: The first successful result.
+        """
+        self._count('requests')
+        primary = self.providers[0]
+        secondary = self.providers[1] if len(self.providers) > 1 else None
+        if not self._can_hedge():
+            return self._fetch_direct(primary, secondary, location)
+        
+        primary_future = self._executor.submit(self._timed, primary, location)
+        # Record primary latency even when a hedge wins, so slow responses
+        # are not left out of the percentile
+        primary_future.add_done_callback(self._record_latency)
+        futures = {primary_future: 'primary'}
+        done, _ = wait([primary_future], timeout=self.hedge_delay())
+        if not done and self._take_hedge():
+            logger.debug(f"Hedging weather request for {location} to {(secondary or primary).name}")
+            futures[self._executor.submit(self._timed, secondary or primary, location)] = 'hedge'
+        
+        error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result, _ = future.result()
+                except Exception as e:
+                    logger.warning(f"Weather {futures[future]} request for {location} failed: {str(e)}")
+                    if futures[future] == 'hedge':
+                        # A hedge must never fail a request the primary can still answer
+                        self._count('hedge_errors')
+                        continue
+                    if not self._is_retryable(e):
+                        self._count('errors')
+                        raise
+                    error = e
+                    continue
+                if futures[future] == 'hedge':
+                    self._count('hedge_wins')
+                return result
+        
+        # Every request failed, fall back to the secondary if it was not tried
+        if secondary is not None and 'hedge' not in futures.values():
+            return self._fall_back(secondary, location)
+        self._count('errors')
+        raise error
+    
+    def _fetch_direct(self, primary, secondary, location):
+        # Without a hedge to race there is nothing to gain from the executor,
+        # so the request thread calls the upstream itself
+        delay = self.hedge_delay()
+        try:
+            result, elapsed = self._timed(primary, location)
+        except Exception as e:
+            if secondary is None or not self._is_retryable(e):
+                self._count('errors')
+                raise
+            logger.warning(f"Weather primary request for {location} failed: {str(e)}")
+            return self._fall_back(secondary, location)
+        with self._lock:
+            self._latencies.append(elapsed)
+            if elapsed > delay and self.hedge_budget > 0:
+                # Slow enough to hedge, but the budget had no room
+                self._metrics['hedges_over_budget'] += 1
+        return result
+    
+    def _fall_back(self, secondary, location):
+        self._count('fallbacks')
+        try:
+            result = secondary.fetch_current(location)
+        except Exception:
+            self._count('errors')
+            raise
+        self._count('fallback_wins')
+        return result
+
+_fetchers = {}
+
+def get_fetcher(api_key):
+    """
+    Returns this process's HedgedFetcher for an API key, built from the
+    environment:
+    
+    - WEATHER_HEDGE_BUDGET: fraction of requests that may be hedged (default 0, off)
+    - WEATHER_HEDGE_PERCENTILE: latency percentile that triggers a hedge (default 95)
+    - WEATHER_SECONDARY_BASE_URL: root of an OpenWeatherMap-compatible secondary API
+    - WEATHER_SECONDARY_API_KEY: key for the secondary (defaults to api_key)
+    - WEATHER_UPSTREAM_TIMEOUT: per-request timeout in seconds (default 10)
+    
+    Args:
+        api_key (str): OpenWeatherMap API key.
+        
+    Returns:
+        HedgedFetcher: The fetcher.
+    """
+    key = (os.getpid(), api_key)
+    fetcher = _fetchers.get(key)
+    if fetcher is None:
+        timeout = float(os.environ.get("WEATHER_UPSTREAM_TIMEOUT", "10"))
+        providers = [OpenWeatherMapProvider(api_key, timeout=timeout)]
+        secondary_url = os.environ.get("WEATHER_SECONDARY_BASE_URL")
+        if secondary_url:
+            providers.append(OpenWeatherMapProvider(
+                os.environ.get("WEATHER_SECONDARY_API_KEY", api_key),
+                base_url=secondary_url, name='secondary', timeout=timeout
+            ))
+        fetcher = HedgedFetcher(
+            providers,
+            hedge_budget=float(os.environ.get("WEATHER_HEDGE_BUDGET", "0")),
+            hedge_percentile=float(os.environ.get("WEATHER_HEDGE_PERCENTILE", "95")),
+            # A hedged request can hold two upstream threads
+            max_workers=2 * WORKER_THREADS
+        )
+        _fetchers[key] = fetcher
+    return fetcher
+
 def get_weather_data(location, api_key):
     """
     Fetches current weather data from OpenWeatherMap API.
@@ -17,40 +542,26 @@ def get_weather_data(location, api_key):
     Returns:
         dict: Weather data including temperature, humidity, etc.
     """
+    return fetch_observation(location, api_key).to_dict()
+
+def fetch_observation(location, api_key):
+    """
+    Fetches current weather from OpenWeatherMap API as a compact Observation.
+    
+    Args:
+        location (str): The city name or coordinates.
+        api_key (str): OpenWeatherMap API key.
+        
+    Returns:
+        Observation: The current weather observation.
+    """
     if not api_key:
         raise ValueError("OpenWeatherMap API key is required")
     
-    url = f"https://api.openweathermap.org/data/2.5/weather"
-    params = {
-        'q': location,
-        'appid': api_key,
-        'units': 'metric'  # Use metric units (Celsius)
-    }
-    
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()  # Raises an exception for HTTP errors
-        
-        data = response.json()
+        observation = get_fetcher(api_key).fetch(location)
         logger.debug(f"Weather data fetched successfully for {location}")
-        
-        # Format the response data
-        weather_data = {
-            'location': data['name'],
-            'country': data['sys']['country'],
-            'temperature': data['main']['temp'],
-            'feels_like': data['main']['feels_like'],
-            'humidity': data['main']['humidity'],
-            'pressure': data['main']['pressure'],
-            'wind_speed': data['wind']['speed'],
-            'description': data['weather'][0]['description'],
-            'icon': data['weather'][0]['icon'],
-            'timestamp': datetime.now().isoformat(),
-            'sunrise': datetime.fromtimestamp(data['sys']['sunrise']).strftime('%H:%M'),
-            'sunset': datetime.fromtimestamp(data['sys']['sunset']).strftime('%H:%M')
-        }
-        
-        return weather_data
+        return observation
     
     except requests.exceptions.RequestException as e:
         logger.error(f"Error fetching weather data: {str(e)}")
@@ -68,10 +579,24 @@ def get_forecast(location, api_key, days=5):
     Returns:
         dict: Weather forecast data.
     """
+    return fetch_forecast_series(location, api_key, days=days).to_dict()
+
+def fetch_forecast_series(location, api_key, days=5):
+    """
+    Fetches weather forecast from OpenWeatherMap API as a compact ForecastSeries.
+    
+    Args:
+        location (str): The city name or coordinates.
+        api_key (str): OpenWeatherMap API key.
+        days (int): Number of days for forecast.
+        
+    Returns:
+        ForecastSeries: One forecast entry per day.
+    """
     if not api_key:
         raise ValueError("OpenWeatherMap API key is required")
     
-    url = f"https://api.openweathermap.org/data/2.5/forecast"
+    url = f"{OPENWEATHER_BASE_URL}/data/2.5/forecast"
     params = {
         'q': location,
         'appid': api_key,
@@ -79,32 +604,12 @@ def get_forecast(location, api_key, days=5):
     }
     
     try:
-        response = requests.get(url, params=params)
+        response = get_session().get(url, params=params)
         response.raise_for_status()
         
-        data = response.json()
+        series = ForecastSeries.from_json(response.json(), days=days)
         logger.debug(f"Forecast data fetched successfully for {location}")
-        
-        # Format the forecast data (every 8th entry is approximately a day)
-        forecast_data = []
-        for i, forecast in enumerate(data['list']):
-            if i % 8 == 0 and len(forecast_data) < days:  # Get one entry per day
-                forecast_item = {
-                    'date': datetime.fromtimestamp(forecast['dt']).strftime('%Y-%m-%d'),
-                    'day': datetime.fromtimestamp(forecast['dt']).strftime('%A'),
-                    'temperature': forecast['main']['temp'],
-                    'feels_like': forecast['main']['feels_like'],
-                    'humidity': forecast['main']['humidity'],
-                    'description': forecast['weather'][0]['description'],
-                    'icon': forecast['weather'][0]['icon']
-                }
-                forecast_data.append(forecast_item)
-        
-        return {
-            'location': data['city']['name'],
-            'country': data['city']['country'],
-            'forecast': forecast_data
-        }
+        return series
     
     except requests.exceptions.RequestException as e:
         logger.error(f"Error fetching forecast data: {str(e)}")
@@ -126,14 +631,14 @@ def get_weather_alerts(location, api_key):
     
     # First, get the coordinates from the location
     try:
-        geo_url = f"https://api.openweathermap.org/geo/1.0/direct"
+        geo_url = f"{OPENWEATHER_BASE_URL}/geo/1.0/direct"
         geo_params = {
             'q': location,
             'limit': 1,
             'appid': api_key
         }
         
-        geo_response = requests.get(geo_url, params=geo_params)
+        geo_response = get_session().get(geo_url, params=geo_params)
         geo_response.raise_for_status()
         
         geo_data = geo_response.json()
@@ -145,7 +650,7 @@ def get_weather_alerts(location, api_key):
         
         # Try to use the One Call API (which requires paid subscription)
         try:
-            url = f"https://api.openweathermap.org/data/2.5/onecall"
+            url = f"{OPENWEATHER_BASE_URL}/data/2.5/onecall"
             params = {
                 'lat': lat,
                 'lon': lon,
@@ -154,7 +659,7 @@ def get_weather_alerts(location, api_key):
                 'units': 'metric'
             }
             
-            response = requests.get(url, params=params)
+            response = get_session().get(url, params=params)
             response.raise_for_status()
             
             data = response.json()